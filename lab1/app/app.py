@@ -1,11 +1,17 @@
-import random
-from flask import Flask, render_template
-from faker import Faker
+import click
+from flask import Flask, render_template, request, abort
 
-fake = Faker()
+from assets import Assets
+from page_cache import PageCache
+from posts_store import PostStore
 
 app = Flask(__name__)
 application = app
+assets = Assets(app, thumbnails='images/*.jpg')
+page_cache = PageCache(app)
+post_store = PostStore(app)
+
+PER_PAGE = 10
 
 images_ids = ['7d4e9175-95ea-4c5f-8be5-92a6b708bb3c',
               '2d2ab7df-cdbc-48a8-a936-35bba702def5',
@@ -13,43 +19,40 @@ images_ids = ['7d4e9175-95ea-4c5f-8be5-92a6b708bb3c',
               'afc2cfe7-5cac-4b80-9b9a-d5c65ef0c728',
               'cab5b7f2-774e-4884-a200-0c0180fa777f']
 
-def generate_comments(replies=True):
-    comments = []
-    for i in range(random.randint(1, 3)):
-        comment = { 'author': fake.name(), 'text': fake.text() }
-        if replies:
-            comment['replies'] = generate_comments(replies=False)
-        comments.append(comment)
-    return comments
-
-def generate_post(i):
-    return {
-        'title': 'Заголовок поста',
-        'text': fake.paragraph(nb_sentences=100),
-        'author': fake.name(),
-        'date': fake.date_time_between(start_date='-2y', end_date='now'),
-        'image_id': f'{images_ids[i]}.jpg',
-        'comments': generate_comments()
-    }
-
-posts_list = sorted([generate_post(i) for i in range(5)], key=lambda p: p['date'], reverse=True)
+@app.cli.command('seed-posts')
+@click.argument('count', type=int, default=5)
+@click.option('--reset', is_flag=True, help='Удалить существующие посты перед заполнением')
+def seed_posts(count, reset):
+    from faker import Faker
+
+    if reset:
+        post_store.clear()
+    post_store.seed(Faker(), count, images_ids)
+    click.echo(f'Добавлено постов: {count}')
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/posts')
+@page_cache.cached(ttl=300, tags=('posts',))
 def posts():
-    return render_template('posts.html', title='Посты', posts=posts_list)
-
-@app.route('/posts/<int:index>')
-def post(index):
-    p = posts_list[index]
-    return render_template('post.html', title=p['title'], post=p)
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts_page, has_next = post_store.list_posts(page, PER_PAGE)
+    return render_template('posts.html', title='Посты', posts=posts_page, page=page, has_next=has_next)
+
+@app.route('/posts/<int:post_id>')
+@page_cache.cached(ttl=300, tags=('posts',))
+def post(post_id):
+    p = post_store.get_post(post_id)
+    if p is None:
+        abort(404)
+    return render_template('post.html', title=p['title'], post=p,
+                           load_comments=lambda: post_store.get_comments(post_id))
 
 @app.route('/about')
 def about():
     return render_template('about.html', title='Об авторе')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
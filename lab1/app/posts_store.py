@@ -0,0 +1,113 @@
+import os
+import random
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    text TEXT NOT NULL,
+    author TEXT NOT NULL,
+    date TEXT NOT NULL,
+    image_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_date ON posts (date, id);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts (id),
+    parent_id INTEGER REFERENCES comments (id),
+    author TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_post_id ON comments (post_id, id);
+"""
+PREVIEW_LENGTH = 200
+
+
+def _post(row):
+    post = dict(row)
+    post['date'] = datetime.fromisoformat(post['date'])
+    return post
+
+
+class PostStore:
+    def __init__(self, app):
+        self.path = app.config.get('POSTS_DATABASE') or os.path.join(app.instance_path, 'posts.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._session() as connection:
+            connection.executescript(SCHEMA)
+        app.teardown_appcontext(self.disconnect)
+
+    def connect(self):
+        if 'posts_db' not in g:
+            g.posts_db = sqlite3.connect(self.path)
+            g.posts_db.row_factory = sqlite3.Row
+        return g.posts_db
+
+    def disconnect(self, e=None):
+        connection = g.pop('posts_db', None)
+        if connection is not None:
+            connection.close()
+
+    def list_posts(self, page=1, per_page=10):
+        rows = self.connect().execute(
+            "SELECT id, title, substr(text, 1, ?) AS text, author, date, image_id FROM posts "
+            "ORDER BY date DESC, id DESC LIMIT ? OFFSET ?",
+            (PREVIEW_LENGTH, per_page + 1, (page - 1) * per_page)).fetchall()
+        return [_post(row) for row in rows[:per_page]], len(rows) > per_page
+
+    def get_post(self, post_id):
+        row = self.connect().execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return _post(row) if row is not None else None
+
+    def get_comments(self, post_id):
+        comments = {}
+        roots = []
+        for row in self.connect().execute(
+                "SELECT id, parent_id, author, text FROM comments WHERE post_id = ? ORDER BY id", (post_id,)):
+            comment = {'author': row['author'], 'text': row['text'], 'replies': []}
+            comments[row['id']] = comment
+            parent = comments.get(row['parent_id'])
+            (parent['replies'] if parent is not None else roots).append(comment)
+        return roots
+
+    def seed(self, fake, count, image_ids, batch_size=1000):
+        rnd = random.Random()
+        with self._session() as connection:
+            next_comment_id = connection.execute("SELECT coalesce(max(id), 0) + 1 FROM comments").fetchone()[0]
+            next_post_id = connection.execute("SELECT coalesce(max(id), 0) + 1 FROM posts").fetchone()[0]
+            for start in range(0, count, batch_size):
+                posts, comments = [], []
+                for post_id in range(next_post_id + start, next_post_id + min(start + batch_size, count)):
+                    date = fake.date_time_between(start_date='-2y', end_date='now')
+                    posts.append((post_id, 'Заголовок поста', fake.paragraph(nb_sentences=100), fake.name(),
+                                  date.strftime('%Y-%m-%d %H:%M:%S'), f'{rnd.choice(image_ids)}.jpg'))
+                    for _ in range(rnd.randint(1, 3)):
+                        parent_id = next_comment_id
+                        comments.append((parent_id, post_id, None, fake.name(), fake.text()))
+                        next_comment_id += 1
+                        for _ in range(rnd.randint(1, 3)):
+                            comments.append((next_comment_id, post_id, parent_id, fake.name(), fake.text()))
+                            next_comment_id += 1
+                connection.executemany("INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?)", posts)
+                connection.executemany("INSERT INTO comments VALUES (?, ?, ?, ?, ?)", comments)
+                connection.commit()
+        return count
+
+    def clear(self):
+        with self._session() as connection:
+            connection.execute("DELETE FROM comments")
+            connection.execute("DELETE FROM posts")
+
+    @contextmanager
+    def _session(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
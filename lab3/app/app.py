@@ -1,10 +1,12 @@
 from flask import Flask, render_template, session, request, redirect, url_for, flash
 from flask_login import LoginManager, login_user, logout_user, UserMixin, current_user, login_required
 import config
+from sessions import ServerSessions
 
 app = Flask(__name__)
 application = app
 app.config.from_object(config)
+server_sessions = ServerSessions(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
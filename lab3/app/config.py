@@ -1,3 +1,6 @@
 import os
 
 SECRET_KEY = 'SECRET_KEY'
+
+SESSION_STORE = 'sqlite'
+SESSION_SWEEP_INTERVAL = 300
@@ -1,18 +1,29 @@
-import datetime
-import re
 from functools import wraps
 
 import mysql.connector as connector
-from flask import Flask, render_template, session, request, redirect, url_for, flash
+from flask import Flask, render_template, session, request, redirect, url_for, flash, jsonify, Response, abort
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 
+from assets import Assets
+from metrics import Metrics
 from mysqldb import DBConnector
+from passwords import Passwords, PasswordHasherBusy
+from sessions import ServerSessions
+from user_listing import UserListing
+from validation import user_validator
 
 app = Flask(__name__)
 application = app
 app.config.from_pyfile('config.py')
 
-db_connector = DBConnector(app)
+metrics = Metrics(app)
+db_connector = DBConnector(app, metrics=metrics)
+server_sessions = ServerSessions(app, db_connector)
+metrics.register_gauges('db_pool', lambda: db_connector.pool.stats())
+metrics.register_gauges('prepared_statements', db_connector.statement_stats)
+metrics.register_gauges('sessions', server_sessions.stats)
+passwords = Passwords(app)
+assets = Assets(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -23,20 +34,14 @@ login_manager.login_message_category = 'warning'
 def db_operation(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time, end_time = None, None
         connection = db_connector.connect()
         try:
-            start_time = datetime.datetime.now()
             with connection.cursor(named_tuple=True, buffered=True) as cursor:
                 result = func(cursor, *args, **kwargs)
                 connection.commit()
         except Exception as e:
             connection.rollback()
             raise e
-        finally:
-            end_time = datetime.datetime.now()
-            print(f"Duration {func}: {end_time - start_time}")
-            # connection.close()
         return result
 
     return wrapper
@@ -55,11 +60,9 @@ def get_roles(cursor):
 
 @login_manager.user_loader
 def load_user(user_id):
-    with db_connector.connect().cursor(named_tuple=True) as cursor:
-        cursor.execute("SELECT id, login FROM users WHERE id = %s;", (user_id,))
-        user = cursor.fetchone()
-    if user is not None:
-        return User(user.id, user.login)
+    rows = db_connector.execute_prepared("SELECT id, login FROM users WHERE id = %s", (user_id,))
+    if rows:
+        return User(rows[0].id, rows[0].login)
     return None
 
 
@@ -82,11 +85,17 @@ def auth(cursor):
         password = request.form['password']
         remember_me = request.form.get('remember_me', None) == 'on'
 
-        cursor.execute(
-            "SELECT id, login FROM users WHERE login = %s AND password_hash = SHA2(%s, 256)",
-            (login, password)
-        )
-        user = cursor.fetchone()
+        rows = db_connector.execute_prepared("SELECT id, login, password_hash FROM users WHERE login = %s", (login,))
+        user = rows[0] if rows else None
+        try:
+            valid, new_hash = passwords.verify(password, user.password_hash if user else None)
+        except PasswordHasherBusy:
+            flash('Сервер перегружен, попробуйте войти позже', 'warning')
+            return render_template('auth.html'), 503
+        if not valid:
+            user = None
+        elif new_hash is not None:
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user.id))
 
         if user:
             flash('Авторизация прошла успешно', 'success')
@@ -102,6 +111,15 @@ def logout():
     return redirect(url_for('index'))
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.authorized():
+        abort(403)
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.summary())
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/counter')
 def counter():
     session['counter'] = session.get('counter', 0) + 1
@@ -111,9 +129,11 @@ def counter():
 @app.route('/users')
 @db_operation
 def users(cursor):
-    cursor.execute("SELECT users.*, roles.name AS role FROM users LEFT JOIN roles ON users.role_id = roles.id")
-    users = cursor.fetchall()
-    return render_template('users.html', users=users)
+    listing = UserListing(request.args)
+    users = listing.fetch(cursor)
+    if request.args.get('format') == 'json':
+        return listing.json_response(users)
+    return render_template('users.html', users=users, listing=listing, roles=get_roles(cursor))
 
 
 @app.route('/users/<int:user_id>/delete', methods=['POST'])
@@ -125,74 +145,6 @@ def users_delete(cursor, user_id):
     flash('Учетная запись успешно удалена', 'success')
     return redirect(url_for('users'))
 
-def validate_first_name(first_name):
-    errors = ""
-    try:
-        if not first_name:
-            raise ValueError("Имя не может быть пустым.")
-        if not re.match(r'^[a-zA-Zа-яА-ЯёЁ]+$', first_name):
-            raise ValueError("Имя должно содержать только буквы.")
-    except Exception as e:
-        errors = e
-
-    return errors
-
-
-def validate_last_name(last_name):
-    errors = ""
-    try:
-        if not last_name:
-            raise ValueError("Фамилия не может быть пустой.")
-        if not re.match(r'^[a-zA-Zа-яА-ЯёЁ]+$', last_name):
-            raise ValueError("Фамилия должна содержать только буквы.")
-    except Exception as e:
-        errors = e
-
-    return errors
-
-
-def validate_login(login):
-    errors = ""
-    try:
-        if not login:
-            raise ValueError("Логин не может быть пустым.")
-        if len(login) < 5:
-            raise ValueError("Логин должен быть не менее 5 символов.")
-        if not login or not re.match(r'^[a-zA-Z0-9]+$', login):
-            raise ValueError("Логин должен состоять только из латинских букв и цифр.")
-
-    except Exception as e:
-        errors = e
-
-    return errors
-
-
-def validate_password(password):
-    errors = ""
-    try:
-        if not password:
-            raise ValueError("Пароль не может быть пустым.")
-        if len(password) < 8:
-            raise ValueError("Пароль должен содержать не менее 8 символов")
-        if len(password) > 128:
-            raise ValueError("Пароль должен содержать не более 128 символов")
-        if not re.search(r'[a-z]', password):
-            raise ValueError("Пароль должен содержать как минимум одну строчную букву")
-        if not re.search(r'[A-Z]', password):
-            raise ValueError("Пароль должен содержать как минимум одну заглавную букву")
-        if not re.search(r'\d', password):
-            raise ValueError("Пароль должен содержать как минимум одну цифру")
-        if not re.match(r'^[a-zA-Zа-яА-Я0-9~!@#$%^&*_+()[\]{}<>\\/|"\'.,:;]*$', password):
-            raise ValueError(
-                "Пароль должен состоять только из латинских или кириллических букв, арабских цифр и допустимых символов")
-        if ' ' in password:
-            raise ValueError("Пароль не должен содержать пробелов")
-
-    except Exception as e:
-        errors = e
-
-    return errors
-
 @app.route('/users/new', methods=['POST', 'GET'])
 @login_required
 @db_operation
@@ -202,12 +154,8 @@ def users_new(cursor):
     if request.method == 'POST':
         fields = ('login', 'password', 'first_name', 'middle_name', 'last_name', 'role_id')
         user_data = {field: request.form[field] or None for field in fields}
-        errors['login'] = validate_login(user_data['login'])
-        errors['password'] = validate_password(user_data['password'])
-        errors['first_name'] = validate_first_name(user_data['first_name'])
-        errors['last_name'] = validate_last_name(user_data['last_name'])
-
-        if errors['login'] or errors['password'] or errors['first_name'] or errors['last_name']:
+        errors = user_validator.validate(user_data)
+        if errors:
             return render_template(
                 'users_new.html',
                 user_data=user_data,
@@ -218,28 +166,27 @@ def users_new(cursor):
         try:
             query = (
                 "INSERT INTO users (login, password_hash, first_name, middle_name, last_name, role_id) VALUES "
-                "(%(login)s, SHA2(%(password)s, 256), %(first_name)s, %(middle_name)s, %(last_name)s, %(role_id)s)"
+                "(%(login)s, %(password_hash)s, %(first_name)s, %(middle_name)s, %(last_name)s, %(role_id)s)"
             )
-            cursor.execute(query, user_data)
+            cursor.execute(query, dict(user_data, password_hash=passwords.hash(user_data['password'])))
             flash('Учетная запись успешно создана', 'success')
             return redirect(url_for('users'))
+        except PasswordHasherBusy:
+            flash('Сервер перегружен, попробуйте позже', 'warning')
+            return render_template('users_new.html', user_data=user_data, roles=get_roles(cursor), errors={}), 503
         except connector.errors.DatabaseError:
             flash('Произошла ошибка при создании записи. Проверьте, что все необходимые поля заполнены', 'danger')
     return render_template('users_new.html', user_data=user_data, roles=get_roles(cursor), errors={})
 
 
 @app.route('/users/<int:user_id>/view')
-@db_operation
-def users_view(cursor, user_id):
-    query = "SELECT * FROM users WHERE id = %s"
-    cursor.execute(query, [user_id])
-    user_data = cursor.fetchone()
-    if not user_data:
+def users_view(user_id):
+    rows = db_connector.execute_prepared("SELECT * FROM users WHERE id = %s", (user_id,))
+    if not rows:
         flash('Пользователя нет в базе данных', 'danger')
         return redirect(url_for('users'))
-    query = "SELECT name FROM roles WHERE id = %s"
-    cursor.execute(query, [user_data.role_id])
-    user_role = cursor.fetchone()
+    user_data = rows[0]
+    user_role = db_connector.execute_prepared("SELECT name FROM roles WHERE id = %s", (user_data.role_id,))[0]
     return render_template('users_view.html', user_data=user_data, user_role=user_role.name)
 
 
@@ -281,19 +228,26 @@ def change_password(cursor):
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
         if confirm_password != new_password:
-            errors['confirm_password'] = "Пароли должны совпадать"
-
-        cursor.execute("SELECT id FROM users WHERE id = %s AND password_hash = SHA2(%s, 256)", (user_id, old_password))
-
-        if not cursor.fetchone():
-            errors['old_password'] = "Введён неверный пароль"
+            errors['confirm_password'] = ["Пароли должны совпадать"]
 
-        errors['new_password'] = validate_password(new_password)
-
-        if not errors['new_password'] and not errors['new_password']:
-            cursor.execute("UPDATE users SET password_hash = SHA2(%s, 256) WHERE id = %s", (new_password, user_id))
-            flash("Вы успешно сменили пароль", "susses")
-            return redirect(url_for('users'))
+        cursor.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        try:
+            if not passwords.verify(old_password, user.password_hash if user else None)[0]:
+                errors['old_password'] = ["Введён неверный пароль"]
+
+            new_password_errors = user_validator.check('password', new_password)
+            if new_password_errors:
+                errors['new_password'] = new_password_errors
+
+            if not errors:
+                cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s",
+                               (passwords.hash(new_password), user_id))
+                flash("Вы успешно сменили пароль", "susses")
+                return redirect(url_for('users'))
+        except PasswordHasherBusy:
+            flash('Сервер перегружен, попробуйте позже', 'warning')
+            return render_template('change_password.html', errors={}), 503
 
     return render_template('change_password.html', errors=errors)
 
@@ -0,0 +1,146 @@
+import fnmatch
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import request, send_from_directory
+from flask.cli import AppGroup
+
+# Both are listed in requirements.txt. Without them the build still works, minus .br variants and thumbnails.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DIST = 'dist'
+
+
+class Assets:
+    def __init__(self, app, thumbnails=None):
+        self.app = app
+        self.static_folder = app.static_folder
+        self.dist_folder = os.path.join(self.static_folder, DIST)
+        self.thumbnails = thumbnails
+        self.thumbnail_size = app.config.get('ASSETS_THUMBNAIL_SIZE', (720, 480))
+        self.manifest = self._load_manifest()
+        self._scan_compressed()
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = self.send_static
+        app.jinja_env.globals['thumbnail'] = self.thumbnail
+        app.cli.add_command(self._commands())
+
+    def thumbnail(self, filename):
+        name = f'thumbs/{filename}'
+        return name if name in self.manifest else filename
+
+    def send_static(self, filename):
+        if not filename.startswith(DIST + '/'):
+            return self.app.send_static_file(filename)
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if filename + suffix in self.compressed and candidate in request.accept_encodings:
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(self.static_folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # The name changes with the content, so the file never has to be revalidated.
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def build(self, clean=False):
+        # Files from earlier builds are kept by default: cached pages may still point at them.
+        if clean and os.path.isdir(self.dist_folder):
+            shutil.rmtree(self.dist_folder)
+        os.makedirs(self.dist_folder, exist_ok=True)
+        manifest = {}
+        for filename in self._sources():
+            path = os.path.join(self.static_folder, filename)
+            with open(path, 'rb') as file:
+                data = file.read()
+            manifest[filename] = self._emit(filename, data)
+            if self.thumbnails and Image is not None and fnmatch.fnmatch(filename, self.thumbnails):
+                name = f'thumbs/{filename}'
+                manifest[name] = self._emit(name, self._resize(path))
+        with open(os.path.join(self.dist_folder, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        self.manifest = manifest
+        self._scan_compressed()
+        return manifest
+
+    def _emit(self, filename, data):
+        root, ext = os.path.splitext(filename)
+        name = f'{DIST}/{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(self.static_folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+        if ext in COMPRESSIBLE:
+            variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as file:
+                        file.write(compressed)
+        return name
+
+    def _resize(self, path):
+        with Image.open(path) as image:
+            image.thumbnail(self.thumbnail_size)
+            output = io.BytesIO()
+            image.save(output, format=image.format, quality=85, optimize=True)
+        return output.getvalue()
+
+    def _sources(self):
+        for root, dirs, files in os.walk(self.static_folder):
+            if os.path.abspath(root) == os.path.abspath(self.static_folder) and DIST in dirs:
+                dirs.remove(DIST)
+            for name in sorted(files):
+                yield os.path.relpath(os.path.join(root, name), self.static_folder).replace(os.sep, '/')
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_folder, 'manifest.json')) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _scan_compressed(self):
+        self.compressed = {name + suffix for name in self.manifest.values() for suffix in ('.br', '.gz')
+                           if os.path.exists(os.path.join(self.static_folder, name + suffix))}
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def _commands(self):
+        group = AppGroup('assets', help='Сборка статических файлов с хешем содержимого в имени.')
+
+        @group.command('build')
+        @click.option('--clean', is_flag=True, help='Удалить файлы предыдущих сборок')
+        def build_command(clean):
+            manifest = self.build(clean)
+            click.echo(f'Собрано файлов: {len(manifest)} в {self.dist_folder}')
+            if brotli is None:
+                click.echo('brotli не установлен, собраны только gzip-варианты')
+            if self.thumbnails and Image is None:
+                click.echo('Pillow не установлен, миниатюры не созданы')
+
+        return group
@@ -6,4 +6,28 @@ SECRET_KEY = '6342eb430febed6def4d4063a2fa717907fb4911143de1891c59dca9e0519bd8'
 MYSQL_USER = 'std_1500_lab4'
 MYSQL_DATABASE = 'std_1500_lab4'
 MYSQL_PASSWORD = 'qwertyqq'
-MYSQL_HOST = 'std-mysql.ist.mospolytech.ru'
\ No newline at end of file
+MYSQL_HOST = 'std-mysql.ist.mospolytech.ru'
+
+MYSQL_POOL_SIZE = 5
+MYSQL_POOL_MAX_OVERFLOW = 10
+MYSQL_POOL_TIMEOUT = 30
+MYSQL_POOL_RECYCLE = 3600
+MYSQL_POOL_PING = True
+MYSQL_STATEMENT_CACHE_SIZE = 32
+
+SESSION_STORE = 'mysql'
+SESSION_SWEEP_INTERVAL = 300
+SESSION_POOL_SIZE = 2
+
+PASSWORD_HASHER = 'scrypt'
+PASSWORD_SCRYPT_N = 2 ** 14
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_PBKDF2_ITERATIONS = 600000
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_QUEUE = 32
+PASSWORD_HASH_TIMEOUT = 10
+
+SLOW_QUERY_THRESHOLD = 0.5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
@@ -1,10 +1,212 @@
-from flask import current_app, g
-import mysql.connector
+import importlib.util
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial
+
+from flask import g
+
+from metrics import TracedConnection, normalize_sql
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# The driver is loaded on first use: most of it is only needed once a connection is opened.
+connector = lazy_import('mysql.connector')
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, factory, size=5, max_overflow=10, timeout=30, recycle=3600, ping=True):
+        self.factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping = ping
+        self._idle = deque()
+        self._created_at = {}
+        self._in_use = 0
+        self._opening = 0
+        self._condition = threading.Condition()
+        self._waits = 0
+        self._wait_time = 0.0
+        self._recycled = 0
+        self._discarded = 0
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if len(self._created_at) + self._opening < self.size + self.max_overflow:
+                    connection = None
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f'Не удалось получить соединение за {self.timeout} с')
+                waited = True
+                self._condition.wait(remaining)
+            self._in_use += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - start
+
+        try:
+            if connection is not None and not self._is_usable(connection):
+                # The replacement takes over the slot of the connection being closed.
+                with self._condition:
+                    self._opening += 1
+                self._close(connection)
+                connection = None
+            if connection is None:
+                connection = self._open()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    def release(self, connection):
+        with self._condition:
+            self._in_use -= 1
+            if connection in self._created_at and len(self._idle) < self.size:
+                self._idle.append(connection)
+                connection = None
+            self._condition.notify()
+        if connection is not None:
+            self._close(connection)
+
+    def discard(self, connection):
+        with self._condition:
+            self._in_use -= 1
+            self._discarded += 1
+            self._condition.notify()
+        self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            raise
+        self.release(connection)
+
+    def close(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': len(self._created_at),
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+            }
+
+    def _open(self):
+        try:
+            connection = self.factory()
+        finally:
+            with self._condition:
+                self._opening -= 1
+        with self._condition:
+            self._created_at[connection] = time.monotonic()
+        return connection
+
+    def _close(self, connection):
+        with self._condition:
+            self._created_at.pop(connection, None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, connection):
+        created_at = self._created_at.get(connection)
+        if created_at is None:
+            return False
+        if self.recycle is not None and time.monotonic() - created_at > self.recycle:
+            with self._condition:
+                self._recycled += 1
+            return False
+        if self.ping and hasattr(connection, 'ping'):
+            try:
+                connection.ping(reconnect=False)
+            except Exception:
+                with self._condition:
+                    self._discarded += 1
+                return False
+        return True
+
+
+class StatementCache:
+    def __init__(self, connection, size=32):
+        self.connection = connection
+        self.size = size
+        self._cursors = OrderedDict()
+
+    def cursor(self, query):
+        cursor = self._cursors.get(query)
+        if cursor is not None:
+            self._cursors.move_to_end(query)
+            return cursor, False
+        # A prepared cursor keeps its statement prepared on the server until it is closed.
+        cursor = self.connection.cursor(prepared=True, named_tuple=True)
+        self._cursors[query] = cursor
+        if len(self._cursors) > self.size:
+            self._cursors.popitem(last=False)[1].close()
+        return cursor, True
+
+    def __len__(self):
+        return len(self._cursors)
 
 
 class DBConnector:
-    def __init__(self, app):
+    def __init__(self, app, factory=None, metrics=None):
         self.app = app
+        self.factory = factory
+        self.metrics = metrics
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.statement_cache_size = app.config.get('MYSQL_STATEMENT_CACHE_SIZE', 32)
+        self._statements = weakref.WeakKeyDictionary()
+        self._statement_counts = {}
+        self._statement_lock = threading.Lock()
         self.app.teardown_appcontext(self.disconnect)
 
     def get_config(self):
@@ -15,12 +217,98 @@ class DBConnector:
             'database': self.app.config["MYSQL_DATABASE"]
         }
 
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = self._make_pool(self._connect)
+        return self._pool
+
     def connect(self):
         if 'db' not in g:
-            g.db = mysql.connector.connect(**self.get_config())
+            start = time.monotonic()
+            g.db = self.pool.acquire()
+            self._observe_wait(start)
         return g.db
 
+    def after_commit(self, func, *args):
+        # Caches are invalidated once the change is visible, or a concurrent read could cache the old row again.
+        g.setdefault('db_after_commit', []).append(partial(func, *args))
+
+    def commit(self, connection):
+        connection.commit()
+        for callback in g.pop('db_after_commit', ()):
+            callback()
+
+    def rollback(self, connection):
+        g.pop('db_after_commit', None)
+        connection.rollback()
+
+    def execute_prepared(self, query, params=(), connection=None):
+        connection = connection if connection is not None else self.connect()
+        with self._statement_lock:
+            cache = self._statements.get(connection)
+            if cache is None:
+                cache = self._statements[connection] = StatementCache(connection, self.statement_cache_size)
+        cursor, prepared = cache.cursor(query)
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.with_rows else []
+        with self._statement_lock:
+            counts = self._statement_counts.setdefault(normalize_sql(query), [0, 0])
+            counts[0] += 1
+            counts[1] += prepared
+        return rows
+
+    def statement_stats(self):
+        with self._statement_lock:
+            statements = {query: {'executions': executions, 'prepares': prepares}
+                          for query, (executions, prepares) in self._statement_counts.items()}
+            cached = sum(len(cache) for cache in self._statements.values())
+        executions = sum(item['executions'] for item in statements.values())
+        prepares = sum(item['prepares'] for item in statements.values())
+        return {
+            'executions': executions,
+            'prepares': prepares,
+            'reuse_ratio': 1 - prepares / executions if executions else 0.0,
+            'cached': cached,
+            'statements': statements,
+        }
+
+    def dedicated_pool(self, size):
+        # For writes made while the request still holds its connection: taking them from the shared pool would
+        # need two slots per request, and a full pool of requests would wait on each other until the timeout.
+        return self._make_pool(self._connect, size=size, max_overflow=0)
+
+    def _make_pool(self, connect, **overrides):
+        config = self.app.config
+        options = dict(
+            size=config.get('MYSQL_POOL_SIZE', 5),
+            max_overflow=config.get('MYSQL_POOL_MAX_OVERFLOW', 10),
+            timeout=config.get('MYSQL_POOL_TIMEOUT', 30),
+            recycle=config.get('MYSQL_POOL_RECYCLE', 3600),
+            ping=config.get('MYSQL_POOL_PING', True),
+        )
+        options.update(overrides)
+        return ConnectionPool(connect, **options)
+
+    def _connect(self):
+        connection = self.factory() if self.factory else connector.connect(**self.get_config())
+        if self.metrics is not None:
+            connection = TracedConnection(connection, self.metrics)
+        return connection
+
+    def _observe_wait(self, start):
+        if self.metrics is not None:
+            self.metrics.observe_wait(time.monotonic() - start)
+
     def disconnect(self, e=None):
-        if 'db' in g:
-            g.db.close()
-        g.pop('db', None)
+        connection = g.pop('db', None)
+        if connection is None:
+            return
+        try:
+            connection.rollback()
+        except Exception:
+            self.pool.discard(connection)
+        else:
+            self.pool.release(connection)
@@ -0,0 +1,84 @@
+import re
+
+from flask import jsonify
+
+# Индексы под фильтры и сортировки списка пользователей:
+# CREATE INDEX users_last_name ON users (last_name, first_name, id);
+# CREATE INDEX users_created_at ON users (created_at, id);
+# CREATE INDEX users_role_last_name ON users (role_id, last_name, first_name, id);
+# CREATE FULLTEXT INDEX users_fulltext ON users (first_name, middle_name, last_name, login);
+# login уже покрыт UNIQUE-индексом.
+
+COLUMNS = ("users.id, users.login, users.last_name, users.first_name, users.middle_name, "
+           "roles.name AS role, users.created_at")
+SORTS = {
+    'last_name': ('users.last_name', 'users.first_name', 'users.id'),
+    'login': ('users.login',),
+    'created_at': ('users.created_at', 'users.id'),
+    'role': ('roles.name', 'users.last_name', 'users.id'),
+}
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 100
+
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def fulltext_query(value):
+    return ' '.join(f'+{word}*' for word in _BOOLEAN_OPERATORS.sub(' ', value).split())
+
+
+class UserListing:
+    def __init__(self, args):
+        self.page = max(args.get('page', 1, type=int), 1)
+        self.per_page = min(max(args.get('per_page', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+        self.sort = args.get('sort') if args.get('sort') in SORTS else 'last_name'
+        self.order = 'desc' if args.get('order') == 'desc' else 'asc'
+        self.role_id = args.get('role_id', type=int)
+        self.prefix = args.get('prefix', '').strip()
+        self.q = fulltext_query(args.get('q', ''))
+        self.search = args.get('q', '').strip()
+        self.has_next = False
+
+    @property
+    def offset(self):
+        return (self.page - 1) * self.per_page
+
+    def fetch(self, cursor):
+        conditions, params = [], []
+        if self.role_id is not None:
+            conditions.append("users.role_id = %s")
+            params.append(self.role_id)
+        if self.prefix:
+            conditions.append("users.last_name LIKE %s")
+            params.append(escape_like(self.prefix) + '%')
+        if self.q:
+            conditions.append("MATCH (users.first_name, users.middle_name, users.last_name, users.login) "
+                              "AGAINST (%s IN BOOLEAN MODE)")
+            params.append(self.q)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        order_by = ', '.join(f'{column} {self.order.upper()}' for column in SORTS[self.sort])
+        cursor.execute(f"SELECT {COLUMNS} FROM users LEFT JOIN roles ON users.role_id = roles.id "
+                       f"{where}ORDER BY {order_by} LIMIT %s OFFSET %s",
+                       params + [self.per_page + 1, self.offset])
+        users = cursor.fetchall()
+        self.has_next = len(users) > self.per_page
+        return users[:self.per_page]
+
+    def url_args(self, **overrides):
+        args = {'page': self.page, 'per_page': self.per_page, 'sort': self.sort, 'order': self.order,
+                'role_id': self.role_id, 'prefix': self.prefix, 'q': self.search}
+        args.update(overrides)
+        return {key: value for key, value in args.items() if value not in (None, '')}
+
+    def json_response(self, users):
+        return jsonify(
+            users=[dict(user._asdict(), created_at=user.created_at.isoformat() if user.created_at else None)
+                   for user in users],
+            page=self.page,
+            per_page=self.per_page,
+            next_page=self.page + 1 if self.has_next else None,
+        )
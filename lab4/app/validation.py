@@ -0,0 +1,132 @@
+import re
+import string
+
+LATIN = string.ascii_letters
+CYRILLIC = ''.join(map(chr, range(ord('а'), ord('я') + 1))) + ''.join(map(chr, range(ord('А'), ord('Я') + 1)))
+DIGITS = string.digits
+PASSWORD_SYMBOLS = '~!@#$%^&*_+()[]{}<>\\/|"\'.,:;'
+
+USER_RULES = {
+    'login': (
+        ('required', None, 'Логин не может быть пустым.'),
+        ('min_length', 5, 'Логин должен быть не менее 5 символов.'),
+        ('only', LATIN + DIGITS, 'Логин должен состоять только из латинских букв и цифр.'),
+    ),
+    'password': (
+        ('required', None, 'Пароль не может быть пустым.'),
+        ('min_length', 8, 'Пароль должен содержать не менее 8 символов'),
+        ('max_length', 128, 'Пароль должен содержать не более 128 символов'),
+        ('contains', string.ascii_lowercase, 'Пароль должен содержать как минимум одну строчную букву'),
+        ('contains', string.ascii_uppercase, 'Пароль должен содержать как минимум одну заглавную букву'),
+        ('contains', DIGITS, 'Пароль должен содержать как минимум одну цифру'),
+        ('only', LATIN + CYRILLIC + DIGITS + PASSWORD_SYMBOLS + ' ',
+         'Пароль должен состоять только из латинских или кириллических букв, арабских цифр и допустимых символов'),
+        ('excludes', ' ', 'Пароль не должен содержать пробелов'),
+    ),
+    'first_name': (
+        ('required', None, 'Имя не может быть пустым.'),
+        ('only', LATIN + CYRILLIC + 'ёЁ', 'Имя должно содержать только буквы.'),
+    ),
+    'last_name': (
+        ('required', None, 'Фамилия не может быть пустой.'),
+        ('only', LATIN + CYRILLIC + 'ёЁ', 'Фамилия должна содержать только буквы.'),
+    ),
+}
+
+
+def _compile(kind, argument):
+    if kind == 'min_length':
+        return lambda value: len(value) >= argument
+    if kind == 'max_length':
+        return lambda value: len(value) <= argument
+    if kind == 'pattern':
+        pattern = re.compile(argument)
+        return lambda value: pattern.fullmatch(value) is not None
+    if kind == 'only':
+        pattern = re.compile(f'[{re.escape(argument)}]*')
+        return lambda value: pattern.fullmatch(value) is not None
+    # isdisjoint() walks the string in C and stops at the first hit.
+    chars = frozenset(argument)
+    if kind == 'contains':
+        return lambda value: not chars.isdisjoint(value)
+    if kind == 'excludes':
+        return lambda value: chars.isdisjoint(value)
+    raise ValueError(f'Неизвестное правило: {kind}')
+
+
+def _combine(rules):
+    # Folds the rules of a field into one regex, so a valid value costs a single match.
+    lookaheads, allowed, excluded, min_length, max_length = [], None, '', 0, ''
+    for kind, argument, _ in rules:
+        if kind == 'min_length':
+            min_length = max(min_length, argument)
+        elif kind == 'max_length':
+            max_length = argument if max_length == '' else min(max_length, argument)
+        elif kind == 'pattern':
+            lookaheads.append(f'(?=(?:{argument})\\Z)')
+        elif kind == 'contains':
+            chars = re.escape(argument)
+            lookaheads.append(f'(?=[^{chars}]*[{chars}])')
+        elif kind == 'only':
+            allowed = argument if allowed is None else ''.join(char for char in allowed if char in argument)
+        elif kind == 'excludes':
+            excluded += argument
+    if allowed is not None:
+        body = '[' + re.escape(''.join(char for char in allowed if char not in excluded)) + ']'
+    else:
+        body = f'[^{re.escape(excluded)}]' if excluded else '.'
+    return re.compile(''.join(lookaheads) + f'{body}{{{min_length},{max_length}}}', re.S)
+
+
+class FieldRules:
+    def __init__(self, rules):
+        self.required = None
+        self.checks = []
+        for kind, argument, message in rules:
+            if kind == 'required':
+                self.required = message
+            else:
+                self.checks.append((_compile(kind, argument), message))
+        self.valid = _combine(rules).fullmatch
+
+    def __call__(self, value):
+        if not value:
+            return [self.required] if self.required else []
+        if self.valid(value):
+            return []
+        return [message for check, message in self.checks if not check(value)]
+
+
+class Validator:
+    def __init__(self, rules):
+        self.fields = {field: FieldRules(field_rules) for field, field_rules in rules.items()}
+
+    def check(self, field, value):
+        return self.fields[field](value)
+
+    def validate(self, record, fields=None):
+        errors = {}
+        for field in fields or self.fields:
+            messages = self.fields[field](record.get(field))
+            if messages:
+                errors[field] = messages
+        return errors
+
+    def validate_many(self, records, fields=None):
+        # Names repeat a lot in bulk files, so results are reused per distinct value.
+        seen = {field: {} for field in fields or self.fields}
+        results = []
+        for record in records:
+            errors = {}
+            for field, known in seen.items():
+                value = record.get(field)
+                messages = known.get(value)
+                if messages is None:
+                    messages = known[value] = self.fields[field](value)
+                if messages:
+                    errors[field] = messages
+            results.append(errors)
+        return results
+
+
+user_validator = Validator(USER_RULES)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+
+class ActionLog:
+    def __init__(self, app, db_connector):
+        self.app = app
+        self.db_connector = db_connector
+        self.max_size = app.config.get('ACTION_LOG_MAX_SIZE', 10000)
+        self.batch_size = app.config.get('ACTION_LOG_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('ACTION_LOG_FLUSH_INTERVAL', 1.0)
+        self.overflow = app.config.get('ACTION_LOG_OVERFLOW', 'drop_oldest')
+        self.block_timeout = app.config.get('ACTION_LOG_BLOCK_TIMEOUT', 0.05)
+        self.on_flush = []
+        self.counters = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'failures': 0}
+        self._rows = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stopping = False
+
+    def record(self, user_id, path):
+        row = (user_id, path, time.monotonic())
+        with self._condition:
+            if len(self._rows) >= self.max_size and not self._make_room():
+                self.counters['dropped'] += 1
+                return False
+            self._rows.append(row)
+            self.counters['recorded'] += 1
+            if len(self._rows) >= self.batch_size:
+                self._condition.notify_all()
+        self._start_worker()
+        return True
+
+    def flush(self):
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                    self._condition.notify_all()
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                except Exception:
+                    self.app.logger.exception('Не удалось записать журнал действий')
+                    self._requeue(batch)
+                    break
+                written += len(batch)
+        if written:
+            for callback in self.on_flush:
+                try:
+                    callback()
+                except Exception:
+                    self.app.logger.exception('Ошибка в обработчике записи журнала действий')
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        self.flush()
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, queued=len(self._rows))
+
+    def _make_room(self):
+        if self.overflow == 'drop_oldest':
+            self._rows.popleft()
+            self.counters['dropped'] += 1
+            return True
+        if self.overflow == 'block':
+            return self._condition.wait_for(lambda: len(self._rows) < self.max_size, self.block_timeout)
+        return False
+
+    def _requeue(self, batch):
+        with self._condition:
+            self.counters['failures'] += 1
+            free = max(self.max_size - len(self._rows), 0)
+            self._rows.extendleft(reversed(batch[:free]))
+            self.counters['dropped'] += len(batch) - min(free, len(batch))
+
+    def _write(self, batch):
+        # created_at stays on the database clock, like the column default: each row is dated back by the
+        # time it spent in the queue, so neither the host's clock nor its time zone ends up in the table.
+        values = ', '.join(['(%s, %s, CURRENT_TIMESTAMP(6) - INTERVAL %s MICROSECOND)'] * len(batch))
+        query = f"INSERT INTO user_actions (user_id, path, created_at) VALUES {values}"
+        now = time.monotonic()
+        params = [value for user_id, path, recorded_at in batch
+                  for value in (user_id, path, round((now - recorded_at) * 1000000))]
+        with self.db_connector.pool.connection() as connection:
+            if len(batch) == self.batch_size:
+                # Full batches always have the same shape, so their statement is prepared once per connection.
+                self.db_connector.execute_prepared(query, params, connection)
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(query, params)
+            connection.commit()
+        with self._condition:
+            self.counters['written'] += len(batch)
+            self.counters['flushes'] += 1
+
+    def _start_worker(self):
+        if self._worker is not None:
+            return
+        with self._condition:
+            if self._worker is None and not self._stopping:
+                self._worker = threading.Thread(target=self._run, name='action-log', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopping or len(self._rows) >= self.batch_size,
+                                         self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
@@ -0,0 +1,66 @@
+import random
+import re
+import threading
+from fnmatch import translate
+
+from flask import request
+
+from cache import TTLCache
+
+# Which requests end up in user_actions. Patterns are shell-style and matched against the path without
+# the query string; sampling rates are per endpoint; a hit repeating the same user's hit on the same
+# path within ACTION_LOG_DEDUP_WINDOW seconds is not logged again. Anonymous hits are never deduplicated:
+# visitors behind one proxy share an address, and nothing else tells them apart.
+
+
+def compile_patterns(patterns):
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{translate(pattern)})' for pattern in patterns))
+
+
+class ActionPolicy:
+    def __init__(self, app):
+        self.include = compile_patterns(app.config.get('ACTION_LOG_INCLUDE', ()))
+        self.exclude = compile_patterns(app.config.get('ACTION_LOG_EXCLUDE', ()))
+        self.sampling = dict(app.config.get('ACTION_LOG_SAMPLING', {}))
+        self.normalize = app.config.get('ACTION_LOG_NORMALIZE', False)
+        dedup_window = app.config.get('ACTION_LOG_DEDUP_WINDOW', 0)
+        self.recent = TTLCache(app.config.get('ACTION_LOG_DEDUP_SIZE', 10000), dedup_window) if dedup_window else None
+        self.counters = {'accepted': 0, 'excluded': 0, 'sampled_out': 0, 'deduplicated': 0, 'unmatched': 0}
+        self._lock = threading.Lock()
+
+    def check(self, get_user_id):
+        # Returns the (user_id, path) to log, or None; the user is only looked up for requests that get that far.
+        path = request.path
+        if self.include is not None and not self.include.match(path) or \
+                self.exclude is not None and self.exclude.match(path):
+            self._count('excluded')
+            return None
+        rate = self.sampling.get(request.endpoint, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            self._count('sampled_out')
+            return None
+        if self.normalize:
+            # /users/17/view and /users/18/view are one page for the stats: the route is logged, not the URL.
+            if request.url_rule is None:
+                self._count('unmatched')
+                return None
+            path = request.url_rule.rule
+        user_id = get_user_id()
+        if self.recent is not None and user_id is not None:
+            key = (user_id, path)
+            if self.recent.get(key) is not None:
+                self._count('deduplicated')
+                return None
+            self.recent.set(key, True)
+        self._count('accepted')
+        return user_id, path
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
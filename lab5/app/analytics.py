@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from math import ceil
+
+from cache import TTLCache
+from rollups import ARCHIVED_BUCKET
+
+# Indexes used by the range queries over user_actions (see also user_actions.py):
+#
+# create index user_actions_created_at_id on user_actions (created_at, id);
+# create index user_actions_user_id_created_at_id on user_actions (user_id, created_at, id);
+# create index user_actions_path_created_at on user_actions (path, created_at);
+
+BUCKETS = {
+    'minute': (60, '%%Y-%%m-%%d %%H:%%i:00', '%Y-%m-%d %H:%M:00'),
+    'hour': (3600, '%%Y-%%m-%%d %%H:00:00', '%Y-%m-%d %H:00:00'),
+    'day': (86400, '%%Y-%%m-%%d', '%Y-%m-%d'),
+}
+KEYS = ('path', 'user_id')
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+class Analytics:
+    def __init__(self, app, rollups):
+        self.rollups = rollups
+        self.max_buckets = app.config.get('ANALYTICS_MAX_BUCKETS', 2000)
+        self.max_top = app.config.get('ANALYTICS_MAX_TOP', 100)
+        self.cache = TTLCache(app.config.get('ANALYTICS_CACHE_SIZE', 256), app.config.get('ANALYTICS_CACHE_TTL', 30))
+
+    def visits(self, cursor, start, end, bucket, path=None, user_id=None):
+        if bucket not in BUCKETS:
+            raise AnalyticsError(f'Неизвестный интервал: {bucket}')
+        seconds, sql_format, python_format = BUCKETS[bucket]
+        first = floor_time(start, seconds)
+        if (end - first).total_seconds() / seconds > self.max_buckets:
+            raise AnalyticsError(f'Слишком много интервалов, максимум {self.max_buckets}')
+
+        def compute():
+            source = self._source(start, end, bucket, path=path, user_id=user_id)
+            cursor.execute(f"SELECT DATE_FORMAT({source.time_column}, '{sql_format}') AS bucket, "
+                           f"{source.count} AS visits FROM {source.table} "
+                           f"WHERE {source.where} GROUP BY 1", source.params)
+            counts = dict(cursor.fetchall())
+            series, moment = [], first
+            while moment < end:
+                key = moment.strftime(python_format)
+                series.append({'bucket': key, 'visits': int(counts.get(key, 0))})
+                moment += timedelta(seconds=seconds)
+            return series
+
+        return self._cached(('visits', start, end, bucket, path, user_id), compute)
+
+    def top(self, cursor, start, end, key, limit):
+        self._check_key(key)
+        if not 1 <= limit <= self.max_top:
+            raise AnalyticsError(f'Количество записей должно быть от 1 до {self.max_top}')
+
+        def compute():
+            source = self._source(start, end, key=key)
+            cursor.execute(f"SELECT {source.keys[key]} AS `key`, {source.count} AS visits FROM {source.table} "
+                           f"WHERE {source.where} GROUP BY 1 ORDER BY visits DESC LIMIT %s",
+                           source.params + (limit,))
+            return [{key: (value or None) if key == 'user_id' else value, 'visits': int(visits)}
+                    for value, visits in cursor.fetchall()]
+
+        return self._cached(('top', start, end, key, limit), compute)
+
+    def distribution(self, cursor, start, end, key, percentiles=(50, 90, 95, 99)):
+        self._check_key(key)
+
+        def compute():
+            source = self._source(start, end, key=key)
+            cursor.execute(f"SELECT {source.count} AS visits FROM {source.table} "
+                           f"WHERE {source.where} GROUP BY {source.keys[key]} ORDER BY visits", source.params)
+            counts = [int(row[0]) for row in cursor.fetchall()]
+            if not counts:
+                return {'count': 0, 'total': 0}
+            return {
+                'count': len(counts),
+                'total': sum(counts),
+                'min': counts[0],
+                'max': counts[-1],
+                'mean': sum(counts) / len(counts),
+                'percentiles': {f'p{p}': counts[max(ceil(p / 100 * len(counts)), 1) - 1] for p in percentiles},
+            }
+
+        return self._cached(('distribution', start, end, key, tuple(percentiles)), compute)
+
+    def _cached(self, key, compute):
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.set(key, result)
+        return result
+
+    def _check_key(self, key):
+        if key not in KEYS:
+            raise AnalyticsError(f'Группировка возможна только по {", ".join(KEYS)}')
+
+    def _source(self, start, end, bucket=None, key=None, path=None, user_id=None):
+        by_path = key == 'path' or path is not None
+        by_user = key == 'user_id' or user_id is not None
+        rollup = self.rollups.bucket
+        if (rollup and not (by_path and by_user)
+                and self.rollups.aligned(start, end)
+                and (bucket is None or BUCKETS[bucket][0] >= BUCKETS[rollup][0])):
+            source = _Source('path_visit_rollup' if by_path else 'user_visit_rollup', 'bucket', 'SUM(visits)',
+                             {'path': 'path', 'user_id': 'user_id'})
+            source.add("bucket > %s", ARCHIVED_BUCKET)
+            if user_id is not None:
+                source.add("user_id = %s", user_id)
+        else:
+            purged_before = self.rollups.purged_before
+            if purged_before is not None and start < purged_before:
+                raise AnalyticsError(f'Действия до {purged_before:%Y-%m-%d} перенесены в архив, '
+                                     'для этого периода доступны только интервалы агрегатов')
+            source = _Source('user_actions', 'created_at', 'COUNT(*)',
+                             {'path': 'path', 'user_id': 'COALESCE(user_id, 0)'})
+            if user_id == 0:
+                source.add("user_id IS NULL")
+            elif user_id is not None:
+                source.add("user_id = %s", user_id)
+        if path is not None:
+            source.add("path = %s", path)
+        source.add(f"{source.time_column} >= %s", start)
+        source.add(f"{source.time_column} < %s", end)
+        return source
+
+
+class _Source:
+    def __init__(self, table, time_column, count, keys):
+        self.table = table
+        self.time_column = time_column
+        self.count = count
+        self.keys = keys
+        self.conditions = []
+        self.params = ()
+
+    def add(self, condition, *params):
+        self.conditions.append(condition)
+        self.params += params
+
+    @property
+    def where(self):
+        return ' AND '.join(self.conditions)
+
+
+def floor_time(moment, seconds):
+    epoch = datetime(1970, 1, 1, tzinfo=moment.tzinfo)
+    return moment - timedelta(seconds=(moment - epoch).total_seconds() % seconds)
@@ -1,78 +1,85 @@
-import datetime
-from functools import wraps
+import os
 
-from flask import Flask, render_template, session, request
+import click
+from flask import Flask, render_template, session, request, jsonify, Response, abort, current_app
 from flask_login import current_user, login_required
+from jinja2 import FileSystemBytecodeCache
 
-from mysqldb import DBConnector
+import extensions
 
-app = Flask(__name__)
-application = app
-app.config.from_pyfile('config.py')
 
-db_connector = DBConnector(app)
+def record_action():
+    if request.endpoint == 'static':
+        return
+    action = extensions.action_policy.check(lambda: current_user.id if current_user.is_authenticated else None)
+    if action is not None:
+        extensions.action_log.record(*action)
 
 
-def db_operation(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time, end_time = None, None
-        connection = db_connector.connect()
-        try:
-            start_time = datetime.datetime.now()
-            with connection.cursor(named_tuple=True, buffered=True) as cursor:
-                result = func(cursor, *args, **kwargs)
-                connection.commit()
-        except Exception as e:
-            connection.rollback()
-            raise e
-        finally:
-            end_time = datetime.datetime.now()
-            print(f"Duration {func}: {end_time - start_time}")
-            # connection.close()
-        return result
+def index():
+    return render_template('index.html')
 
-    return wrapper
 
+@login_required
+def secret():
+    return render_template('secret.html')
 
-from auto import bp as auto_bp, init_login_manager
 
-app.register_blueprint(auto_bp)
-init_login_manager(app)
+def metrics_endpoint():
+    if not (current_user.is_authenticated and current_user.is_admin() or extensions.metrics.authorized()):
+        abort(403)
+    if request.args.get('format') == 'json':
+        return jsonify(extensions.metrics.summary())
+    return Response(extensions.metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
-from users import bp as users_bp
 
-app.register_blueprint(users_bp)
+def counter():
+    session['counter'] = session.get('counter', 0) + 1
+    return render_template('counter.html')
 
-from user_actions import bp as user_actions_bp
 
-app.register_blueprint(user_actions_bp)
+def compile_templates():
+    names = current_app.jinja_env.list_templates()
+    for name in names:
+        current_app.jinja_env.get_template(name)
+    click.echo(f'Скомпилировано шаблонов: {len(names)}')
 
 
-@app.before_request
-@db_operation
-def record_action(cursor):
-    if request.endpoint == 'static':
-        return
-    user_id = current_user.id if current_user.is_authenticated else None
-    path = request.path
-    query = "INSERT INTO user_actions (user_id, path) VALUES (%s, %s)"
-    cursor.execute(query, (user_id, path))
+def create_app(config_file='config.py'):
+    app = Flask(__name__)
+    app.config.from_pyfile(config_file)
+    # Compiled templates survive restarts, so a fresh worker renders its first pages without compiling them.
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir))
+    extensions.init_app(app)
 
+    from auto import bp as auto_bp, init_login_manager
+    from user_actions import bp as user_actions_bp
+    from users import bp as users_bp
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+    app.register_blueprint(auto_bp)
+    init_login_manager(app)
+    app.register_blueprint(users_bp)
+    app.register_blueprint(user_actions_bp)
 
+    app.before_request(record_action)
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/secret', view_func=secret)
+    app.add_url_rule('/metrics', view_func=metrics_endpoint)
+    app.add_url_rule('/counter', view_func=counter)
+    app.cli.command('compile-templates')(compile_templates)
+    return app
 
-@app.route('/secret')
-@login_required
-def secret():
-    return render_template('secret.html')
 
+_default_app = None
 
-@app.route('/counter')
-def counter():
-    session['counter'] = session.get('counter', 0) + 1
-    return render_template('counter.html')
 
+def __getattr__(name):
+    # `app:application` keeps working for WSGI hosts; the application is built on first access.
+    global _default_app
+    if name in ('app', 'application'):
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,56 @@
+import asyncio
+import contextvars
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+import app
+
+# uvicorn asgi:application
+#
+# Flask stays a WSGI application: every request holds a thread until it is answered. Async views run on
+# the server's event loop while their thread waits, and their queries run on the DB executor. asgiref
+# would put all requests on one shared thread; ThreadSensitiveContext gives each request a thread of
+# its own, and at most ASGI_THREADS of them run at once.
+#
+# The read-only views of users and user_actions are async. Views that write stay sync: their statements
+# and after_commit hooks share one transaction, while each awaited operation commits on a connection of
+# its own. Logging in stays sync too, as password hashing would block the event loop. CSV/JSONL exports
+# stream rows from the request thread after the view has returned.
+#
+# asgiref keeps that per-request state in context variables, while uvicorn serves all requests of a
+# keep-alive connection in one context. Each request therefore runs in a fresh context; otherwise the
+# second request on a connection inherits the first one's thread and deadlocks.
+
+
+class Application(WsgiToAsgi):
+    def __init__(self, wsgi_application):
+        super().__init__(wsgi_application)
+        self.threads = wsgi_application.config.get('ASGI_THREADS', 15)
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.threads)
+        async with self._slots:
+            await asyncio.create_task(self._serve(scope, receive, send), context=contextvars.Context())
+
+    async def _serve(self, scope, receive, send):
+        async with ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
+
+
+def __getattr__(name):
+    # Like app.py, the application is built on first access, so importing Application creates none.
+    if name == 'application':
+        application = globals()['application'] = Application(app.app)
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
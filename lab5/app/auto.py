@@ -1,12 +1,14 @@
 from functools import wraps
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, g
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user
 
-from app import db_connector, db_operation
-from users_policy import UsersPolicy
+from extensions import db_connector, db_operation, passwords, user_cache, users_policy
+from passwords import PasswordHasherBusy
 
 bp = Blueprint('auto', __name__, url_prefix='/auto')
+# Everything but password_hash, which has no business staying in the user cache.
+USER_QUERY = "SELECT id, login, last_name, first_name, middle_name, role_id, created_at FROM users WHERE id = %s"
 
 
 def init_login_manager(app):
@@ -23,33 +25,58 @@ class User(UserMixin):
         self.id = user_id
         self.user_login = user_login
         self.role_id = role_id
+        self.actions = users_policy.actions(role_id)
 
     def is_admin(self):
         return self.role_id == current_app.config['ADMIN_ROLE_ID']
 
     def can(self, action, user=None):
-        policy = UsersPolicy(user)
-        return getattr(policy, action, lambda: False)()
+        return users_policy.allows(self.actions, self.id, action, user)
+
+    def can_many(self, action, users):
+        return users_policy.allows_many(self.actions, self.id, action, users)
 
 
 def load_user(user_id):
-    with db_connector.connect().cursor(named_tuple=True) as cursor:
-        cursor.execute("SELECT id, login, role_id FROM users WHERE id = %s;", (user_id,))
-        user = cursor.fetchone()
+    try:
+        user = get_user(user_id)
+    except ValueError:
+        return None
     if user is not None:
         return User(user.id, user.login, user.role_id)
     return None
 
 
+def get_user(user_id):
+    user_id = int(user_id)
+    users = g.setdefault('users', {})
+    if user_id not in users:
+        user = user_cache.get(user_id)
+        if user is None:
+            token = user_cache.token()
+            # A lagging replica could put back a row that was just changed, so misses are read from the primary.
+            with db_connector.primary_connection() as connection:
+                rows = db_connector.execute_prepared(USER_QUERY, (user_id,), connection)
+            user = rows[0] if rows else None
+            if user is not None:
+                user_cache.set(user_id, user, token=token)
+        users[user_id] = user
+    return users[user_id]
+
+
+def forget_user(user_id):
+    g.get('users', {}).pop(user_id, None)
+    db_connector.after_commit(user_cache.pop, user_id)
+
+
 def check_for_privelege(action):
     def decorator(function):
         @wraps(function)
         def wrapper(*args, **kwargs):
             user = None
-            if 'user_id' in kwargs.keys():
-                with db_connector.connect().cursor(named_tuple=True) as cursor:
-                    cursor.execute("SELECT * FROM users WHERE id = %s;", (kwargs.get('user_id'),))
-                    user = cursor.fetchone()
+            if (current_user.is_authenticated and 'user_id' in kwargs
+                    and users_policy.needs_target(current_user.actions, action)):
+                user = get_user(kwargs['user_id'])
             if not (current_user.is_authenticated and current_user.can(action, user)):
                 flash('Недостаточно прав для доступа к этой странице', 'warning')
                 return redirect(url_for('users.index'))
@@ -68,9 +95,19 @@ def auth(cursor):
         login = request.form['username']
         password = request.form['password']
         remember_me = request.form.get('remember_me', None) == 'on'
-        cursor.execute("SELECT id, login, role_id FROM users WHERE login = %s AND password_hash = SHA2(%s, 256)",
-                       (login, password))
-        user = cursor.fetchone()
+        rows = db_connector.execute_prepared(
+            "SELECT id, login, role_id, password_hash FROM users WHERE login = %s", (login,))
+        user = rows[0] if rows else None
+        try:
+            valid, new_hash = passwords.verify(password, user.password_hash if user is not None else None)
+        except PasswordHasherBusy:
+            flash('Сервер перегружен, попробуйте войти позже', 'warning')
+            return render_template('auth.html'), 503
+        if not valid:
+            user = None
+        elif new_hash is not None:
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user.id))
+            forget_user(user.id)
 
         if user is not None:
             flash('Авторизация прошла успешно', 'success')
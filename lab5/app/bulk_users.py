@@ -0,0 +1,134 @@
+import csv
+import json
+from itertools import islice
+
+from mysqldb import connector
+from validation import user_validator
+
+FIELDS = ('login', 'password', 'first_name', 'middle_name', 'last_name', 'role_id')
+EXPORT_COLUMNS = ('id', 'login', 'last_name', 'first_name', 'middle_name', 'role_id', 'created_at')
+EXPORT_QUERY = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM users ORDER BY id"
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_rows(lines, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        missing = {'login', 'password', 'first_name', 'last_name'} - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFormatError(f'В заголовке CSV нет столбцов: {", ".join(sorted(missing))}')
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+    else:
+        raise ImportFormatError(f'Неизвестный формат: {fmt}')
+
+
+def _clean(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+class UserImporter:
+    def __init__(self, app, db_connector, passwords, refdata):
+        self.db_connector = db_connector
+        self.passwords = passwords
+        self.refdata = refdata
+        self.batch_size = app.config.get('USER_IMPORT_BATCH_SIZE', 200)
+        self.batches_per_transaction = app.config.get('USER_IMPORT_BATCHES_PER_TRANSACTION', 5)
+        self.max_errors = app.config.get('USER_IMPORT_MAX_ERRORS', 1000)
+
+    def run(self, rows):
+        report = {'total': 0, 'created': 0, 'failed': 0, 'errors': []}
+        role_ids = {role.id for role in self.refdata.get('roles')}
+        seen = set()
+        rows = iter(rows)
+        batches = 0
+        with self.db_connector.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                while True:
+                    chunk = list(islice(rows, self.batch_size))
+                    if not chunk:
+                        break
+                    report['total'] += len(chunk)
+                    batch = self._validate(chunk, role_ids, seen, report)
+                    if batch:
+                        self._insert(cursor, batch, report)
+                    batches += 1
+                    if batches % self.batches_per_transaction == 0:
+                        connection.commit()
+                connection.commit()
+        return report
+
+    def _validate(self, chunk, role_ids, seen, report):
+        users = [None if row is None else {field: _clean(row.get(field)) for field in FIELDS} for _, row in chunk]
+        results = user_validator.validate_many(user or {} for user in users)
+        batch = []
+        for (number, _), user, errors in zip(chunk, users, results):
+            if user is None:
+                self._fail(report, number, {}, {'row': ['Строка не является JSON-объектом']})
+                continue
+            if user['role_id'] is not None:
+                try:
+                    user['role_id'] = int(user['role_id'])
+                except ValueError:
+                    user['role_id'] = None
+                if user['role_id'] not in role_ids:
+                    errors['role_id'] = ['Неизвестная роль']
+            if 'login' not in errors:
+                if user['login'] in seen:
+                    errors['login'] = ['Логин повторяется в файле']
+                seen.add(user['login'])
+            if errors:
+                self._fail(report, number, user, errors)
+            else:
+                batch.append((number, user))
+        return batch
+
+    def _insert(self, cursor, batch, report):
+        cursor.execute(f"SELECT login FROM users WHERE login IN ({', '.join(['%s'] * len(batch))})",
+                       [user['login'] for _, user in batch])
+        taken = {login for login, in cursor.fetchall()}
+        for number, user in batch:
+            if user['login'] in taken:
+                self._fail(report, number, user, {'login': ['Пользователь с таким логином уже существует']})
+        batch = [(number, user) for number, user in batch if user['login'] not in taken]
+        if not batch:
+            return
+        hashes = self.passwords.hash_many([user['password'] for _, user in batch])
+        values = [(user['login'], password_hash, user['first_name'], user['middle_name'], user['last_name'],
+                   user['role_id']) for (_, user), password_hash in zip(batch, hashes)]
+        query = ("INSERT INTO users (login, password_hash, first_name, middle_name, last_name, role_id) VALUES "
+                 + ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(values)))
+        try:
+            cursor.execute(query, [value for row in values for value in row])
+            report['created'] += len(values)
+            return
+        except connector.errors.DatabaseError:
+            pass
+        # A failed statement is rolled back on its own; retry row by row to find the culprits.
+        for (number, user), row in zip(batch, values):
+            try:
+                cursor.execute("INSERT INTO users (login, password_hash, first_name, middle_name, last_name, role_id) "
+                               "VALUES (%s, %s, %s, %s, %s, %s)", row)
+                report['created'] += 1
+            except connector.errors.DatabaseError as error:
+                self._fail(report, number, user, {'row': [str(error)]})
+
+    def _fail(self, report, number, user, errors):
+        report['failed'] += 1
+        if len(report['errors']) < self.max_errors:
+            report['errors'].append({'line': number, 'login': user.get('login'), 'errors': errors})
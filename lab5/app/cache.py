@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def token(self):
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, ttl=None, token=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if token is not None and token != self._generation:
+                # Something was invalidated while the value was loaded, so it may already be stale.
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            self._generation += 1
+        return None if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RefreshingCache:
+    def __init__(self, ttl=60, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            item = self._values.get(key)
+            if item is not None:
+                self._values.move_to_end(key)
+            stale = item is not None and item[1] + self.ttl < time.monotonic()
+            if stale and key not in self._refreshing:
+                self._refreshing.add(key)
+                threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+        if item is None:
+            value = loader()
+            self._store(key, value)
+            return value
+        return item[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._values),
+                'max_size': self.max_size,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+            }
+
+    def _store(self, key, value, refreshed=False):
+        with self._lock:
+            self._values[key] = (value, time.monotonic())
+            self._values.move_to_end(key)
+            self.refreshes += refreshed
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+                self.evictions += 1
+
+    def _refresh(self, key, loader):
+        try:
+            self._store(key, loader(), refreshed=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -8,4 +8,87 @@ MYSQL_PASSWORD = DB_DATA
 MYSQL_HOST = 'rc1b-2xmunoaqhipsaggs.mdb.yandexcloud.net'
 MYSQL_DATABASE = DB_DATA
 
-ADMIN_ROLE_ID = 1
\ No newline at end of file
+ADMIN_ROLE_ID = 1
+ROLE_PERMISSIONS = {
+    ADMIN_ROLE_ID: ('create', 'read', 'update', 'delete', 'assign_role', 'read_statistics', 'import_users',
+                    'export_users'),
+}
+PUBLIC_PERMISSIONS = ('read',)
+
+MYSQL_POOL_SIZE = 5
+MYSQL_POOL_MAX_OVERFLOW = 10
+MYSQL_POOL_TIMEOUT = 30
+MYSQL_POOL_RECYCLE = 3600
+MYSQL_POOL_PING = True
+MYSQL_STATEMENT_CACHE_SIZE = 32
+MYSQL_REPLICAS = []
+MYSQL_REPLICA_BALANCE = 'round_robin'
+MYSQL_REPLICA_CHECK_INTERVAL = 5
+MYSQL_REPLICA_MAX_LAG = 30
+MYSQL_READ_YOUR_WRITES = 5
+
+# Request threads and DB executor threads hold at most one connection each, so neither outnumbers the pool.
+DB_EXECUTOR_WORKERS = MYSQL_POOL_SIZE + MYSQL_POOL_MAX_OVERFLOW
+ASGI_THREADS = MYSQL_POOL_SIZE + MYSQL_POOL_MAX_OVERFLOW
+
+ACTION_LOG_MAX_SIZE = 10000
+ACTION_LOG_BATCH_SIZE = 100
+ACTION_LOG_FLUSH_INTERVAL = 1.0
+ACTION_LOG_OVERFLOW = 'drop_oldest'
+ACTION_LOG_BLOCK_TIMEOUT = 0.05
+ACTION_LOG_INCLUDE = ()
+ACTION_LOG_EXCLUDE = ('/metrics', '/counter', '/favicon.ico', '/user_actions/api/*')
+ACTION_LOG_SAMPLING = {}
+# True logs the route (/users/<int:user_id>/view) instead of the URL, which merges the page stats but
+# loses the real path from user_actions.
+ACTION_LOG_NORMALIZE = False
+ACTION_LOG_DEDUP_WINDOW = 10
+ACTION_LOG_DEDUP_SIZE = 10000
+
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+
+REFDATA_CHECK_INTERVAL = 60
+
+SESSION_STORE = 'mysql'
+SESSION_SWEEP_INTERVAL = 300
+SESSION_POOL_SIZE = 2
+
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+PAGE_CACHE_TTL = 60
+
+USER_ACTIONS_MAX_OFFSET_PAGES = 10
+USER_ACTIONS_COUNT_TTL = 300
+USER_ACTIONS_COUNT_CACHE_SIZE = 1024
+
+ROLLUP_BUCKET = 'day'
+ROLLUP_BATCH_SIZE = 50000
+ROLLUP_INTERVAL = 10
+
+RETENTION_DAYS = 180
+RETENTION_BATCH_SIZE = 5000
+RETENTION_PAUSE = 0.1
+
+EXPORT_CHUNK_SIZE = 1000
+
+USER_IMPORT_BATCH_SIZE = 200
+USER_IMPORT_BATCHES_PER_TRANSACTION = 5
+USER_IMPORT_MAX_ERRORS = 1000
+
+ANALYTICS_MAX_BUCKETS = 2000
+ANALYTICS_MAX_TOP = 100
+ANALYTICS_CACHE_SIZE = 256
+ANALYTICS_CACHE_TTL = 30
+
+PASSWORD_HASHER = 'scrypt'
+PASSWORD_SCRYPT_N = 2 ** 14
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_PBKDF2_ITERATIONS = 600000
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_QUEUE = 32
+PASSWORD_HASH_TIMEOUT = 10
+
+SLOW_QUERY_THRESHOLD = 0.5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
@@ -0,0 +1,70 @@
+import csv
+import json
+import zlib
+
+from flask import Response, stream_with_context
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_rows(connection, query, params=(), chunk_size=1000):
+    with connection.cursor(named_tuple=True) as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+
+def iter_csv(header, rows, lines_per_chunk=500):
+    writer = csv.writer(_Echo())
+    lines = [writer.writerow(header)]
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= lines_per_chunk:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def iter_jsonl(rows, lines_per_chunk=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        if len(lines) >= lines_per_chunk:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename, header, rows, compress=False):
+    return download_response(filename, iter_csv(header, rows), 'text/csv', compress)
+
+
+def jsonl_response(filename, rows, compress=False):
+    return download_response(filename, iter_jsonl(rows), 'application/x-ndjson', compress)
+
+
+def download_response(filename, body, mimetype, compress=False):
+    if compress:
+        body = gzip_chunks(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
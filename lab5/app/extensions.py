@@ -0,0 +1,167 @@
+import asyncio
+import atexit
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from types import SimpleNamespace
+
+from flask import current_app
+from flask_login import current_user
+from werkzeug.local import LocalProxy
+
+from action_log import ActionLog
+from action_policy import ActionPolicy
+from analytics import Analytics
+from assets import Assets
+from bulk_users import UserImporter
+from cache import RefreshingCache, TTLCache
+from metrics import Metrics
+from mysqldb import DBConnector
+from page_cache import PageCache
+from passwords import Passwords
+from refdata import ReferenceData
+from retention import Retention
+from rollups import Rollups
+from sessions import ServerSessions
+from users_policy import UsersPolicy
+
+
+def init_app(app):
+    metrics = Metrics(app)
+    db_connector = DBConnector(app, metrics=metrics)
+    action_log = ActionLog(app, db_connector)
+    atexit.register(action_log.stop)
+    rollups = Rollups(app, db_connector)
+    action_log.on_flush.append(rollups.schedule_refresh)
+    passwords = Passwords(app)
+    refdata = ReferenceData(app, db_connector)
+    services = SimpleNamespace(
+        metrics=metrics,
+        db_connector=db_connector,
+        db_executor=ThreadPoolExecutor(max_workers=app.config.get('DB_EXECUTOR_WORKERS', 16),
+                                       thread_name_prefix='db'),
+        action_log=action_log,
+        action_policy=ActionPolicy(app),
+        rollups=rollups,
+        retention=Retention(app, db_connector, rollups),
+        passwords=passwords,
+        users_policy=UsersPolicy(app),
+        page_cache=PageCache(app),
+        user_cache=TTLCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL']),
+        refdata=refdata,
+        assets=Assets(app),
+        server_sessions=ServerSessions(app, db_connector),
+        importer=UserImporter(app, db_connector, passwords, refdata),
+        analytics=Analytics(app, rollups),
+        action_counts=RefreshingCache(app.config['USER_ACTIONS_COUNT_TTL'],
+                                      app.config.get('USER_ACTIONS_COUNT_CACHE_SIZE', 1024)),
+    )
+    app.extensions['services'] = services
+    refdata.register('roles', "SELECT * FROM roles ORDER BY id", "CHECKSUM TABLE roles")
+    refdata.preload()
+    metrics.register_gauges('db_pool', lambda: db_connector.pool.stats())
+    metrics.register_gauges('db_replicas', db_connector.replica_stats)
+    metrics.register_gauges('prepared_statements', db_connector.statement_stats)
+    metrics.register_gauges('action_log', action_log.stats)
+    metrics.register_gauges('action_policy', services.action_policy.stats)
+    metrics.register_gauges('sessions', services.server_sessions.stats)
+    metrics.register_gauges('user_cache', services.user_cache.stats)
+    metrics.register_gauges('refdata', refdata.stats)
+    metrics.register_gauges('page_cache', services.page_cache.stats)
+    metrics.register_gauges('analytics_cache', services.analytics.cache.stats)
+    metrics.register_gauges('action_counts', services.action_counts.stats)
+    return services
+
+
+def _service(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['services'], name))
+
+
+# Blueprints import these at module level; each one resolves to the service of the application
+# handling the current request, so every create_app() gets its own.
+metrics = _service('metrics')
+db_connector = _service('db_connector')
+db_executor = _service('db_executor')
+action_log = _service('action_log')
+action_policy = _service('action_policy')
+rollups = _service('rollups')
+retention = _service('retention')
+passwords = _service('passwords')
+users_policy = _service('users_policy')
+page_cache = _service('page_cache')
+user_cache = _service('user_cache')
+refdata = _service('refdata')
+assets = _service('assets')
+server_sessions = _service('server_sessions')
+importer = _service('importer')
+analytics = _service('analytics')
+action_counts = _service('action_counts')
+
+
+def cached(ttl=None, tags=(), vary=None):
+    # Views are decorated at import, before any application exists, so the page cache is looked up per
+    # request. A callable ttl is read from the application's config at that point too.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return page_cache.cached(ttl() if callable(ttl) else ttl, tags, vary)(view)(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def db_operation(func=None, *, read_only=False):
+    # read_only=True lets the view read from a replica; other views write to the primary.
+    if func is None:
+        return partial(db_operation, read_only=read_only)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        connection = db_connector.connect(read_only)
+        try:
+            with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                result = func(cursor, *args, **kwargs)
+                db_connector.commit(connection)
+        except Exception as e:
+            db_connector.rollback(connection)
+            raise e
+        return result
+
+    return wrapper
+
+
+def run_db_operation(func, *args, read_only=False):
+    with (db_connector.read_connection() if read_only else db_connector.pool.connection()) as connection:
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            result = func(cursor, *args)
+        connection.commit()
+    return result
+
+
+async def in_db_executor(func, *args):
+    # The copied context keeps request, g and current_user available in the executor thread.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(context.run, func, *args))
+
+
+def async_db_operation(func=None, *, read_only=False):
+    if func is None:
+        return partial(async_db_operation, read_only=read_only)
+
+    # Each awaited operation gets its own pooled connection, so independent queries run concurrently.
+    async def run(operation, *args):
+        return await in_db_executor(partial(run_db_operation, operation, *args, read_only=read_only))
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # The user is loaded here rather than from the coroutine, where a query would block the event loop.
+        current_user.get_id()
+        # The request waits for its operations without holding a connection of its own; otherwise waiting
+        # requests would keep connections their queries need, and the pool would run dry under load.
+        db_connector.disconnect()
+        # Flask runs the coroutine through asgiref: under asgi.py on the server's event loop,
+        # under a WSGI server on a loop of its own.
+        return current_app.ensure_sync(func)(run, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,230 @@
+import hmac
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_STATEMENTS = 500
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUES = re.compile(r'(\((?:%s|\?)(?:, (?:%s|\?))*\))(?:, \1)+')
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.I)
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query):
+    query = _WHITESPACE.sub(' ', query).strip()
+    query = _STRING.sub('?', query)
+    query = _NUMBER.sub('?', query)
+    query = _VALUES.sub(r'\1, ...', query)
+    return _IN_LIST.sub('IN (...)', query)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class Metrics:
+    def __init__(self, app):
+        self.app = app
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD', 0.5)
+        self.token = app.config.get('METRICS_TOKEN')
+        self.allowed_addresses = frozenset(app.config.get('METRICS_ALLOWED_ADDRESSES', ('127.0.0.1', '::1')))
+        self.requests = {}
+        self.queries = {}
+        self.rows = {}
+        self.waits = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    def authorized(self):
+        # Statements, replica errors and pool state are not for every visitor: a scraper either sends
+        # METRICS_TOKEN as a bearer token or connects from one of METRICS_ALLOWED_ADDRESSES.
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if self.token and scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), self.token.encode()):
+            return True
+        return request.remote_addr in self.allowed_addresses
+
+    def register_gauges(self, name, collect):
+        self.gauges[name] = collect
+
+    def endpoint(self):
+        if has_request_context():
+            return request.endpoint or 'unknown'
+        return threading.current_thread().name
+
+    def observe_query(self, query, elapsed):
+        statement = normalize_sql(query)
+        key = (self.endpoint(), statement)
+        with self._lock:
+            if key not in self.queries and len(self.queries) >= MAX_STATEMENTS:
+                key = (key[0], 'other')
+            self.queries.setdefault(key, Histogram()).observe(elapsed)
+        if elapsed >= self.slow_query_threshold:
+            self.app.logger.warning('Медленный запрос (%.3f с) в %s: %s', elapsed, key[0], statement)
+        return key
+
+    def observe_rows(self, key, count):
+        with self._lock:
+            self.rows[key] = self.rows.get(key, 0) + count
+
+    def observe_wait(self, elapsed):
+        with self._lock:
+            self.waits.setdefault(self.endpoint(), Histogram()).observe(elapsed)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'requests': {endpoint: histogram.summary() for endpoint, histogram in self.requests.items()},
+                'connection_wait': {endpoint: histogram.summary() for endpoint, histogram in self.waits.items()},
+                'queries': [dict(histogram.summary(), endpoint=endpoint, statement=statement,
+                                 rows=self.rows.get((endpoint, statement), 0))
+                            for (endpoint, statement), histogram in self.queries.items()],
+                **{name: collect() for name, collect in self.gauges.items()},
+            }
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, 'app_request_seconds', 'Время обработки запроса',
+                                    {(endpoint,): histogram for endpoint, histogram in self.requests.items()},
+                                    ('endpoint',))
+            self._render_histograms(lines, 'app_db_connection_wait_seconds', 'Ожидание соединения из пула',
+                                    {(endpoint,): histogram for endpoint, histogram in self.waits.items()},
+                                    ('endpoint',))
+            self._render_histograms(lines, 'app_sql_query_seconds', 'Время выполнения SQL-запроса',
+                                    self.queries, ('endpoint', 'statement'))
+            lines.append('# HELP app_sql_rows_total Строк получено из SQL-запроса')
+            lines.append('# TYPE app_sql_rows_total counter')
+            for key, count in self.rows.items():
+                lines.append(f'app_sql_rows_total{_labels(("endpoint", "statement"), key)} {count}')
+        for name, collect in self.gauges.items():
+            for key, value in collect().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE app_{name}_{key} gauge')
+                    lines.append(f'app_{name}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _render_histograms(self, lines, name, help_text, histograms, label_names):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in histograms.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_labels(label_names + ("le",), key + (le,))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, key)} {histogram.sum}')
+            lines.append(f'{name}_count{_labels(label_names, key)} {histogram.count}')
+
+    def _start_request(self):
+        g.request_started_at = time.monotonic()
+
+    def _finish_request(self, exc=None):
+        started_at = g.pop('request_started_at', None)
+        if started_at is None:
+            return
+        elapsed = time.monotonic() - started_at
+        with self._lock:
+            self.requests.setdefault(request.endpoint or 'unknown', Histogram()).observe(elapsed)
+
+
+def _labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class TracedConnection:
+    def __init__(self, connection, metrics):
+        self._connection = connection
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._connection.cursor(*args, **kwargs), self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class TracedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._count(1)
+            yield row
+
+    def execute(self, query, params=(), *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return self._cursor.execute(query, params, *args, **kwargs)
+        finally:
+            self._key = self._metrics.observe_query(query, time.monotonic() - start)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+    def _count(self, count):
+        if self._key is not None and count:
+            self._metrics.observe_rows(self._key, int(count))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
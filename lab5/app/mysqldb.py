@@ -1,10 +1,244 @@
-import mysql.connector
-from flask import g
+import importlib.util
+import itertools
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial
+
+from flask import g, has_request_context, session
+
+from metrics import TracedConnection, normalize_sql
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# The driver is loaded on first use: most of it is only needed once a connection is opened.
+connector = lazy_import('mysql.connector')
+
+
+# Session key holding the time until which a session that has written reads from the primary.
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ReplicaLagError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, factory, size=5, max_overflow=10, timeout=30, recycle=3600, ping=True):
+        self.factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping = ping
+        self._idle = deque()
+        self._created_at = {}
+        self._in_use = 0
+        self._opening = 0
+        self._condition = threading.Condition()
+        self._waits = 0
+        self._wait_time = 0.0
+        self._recycled = 0
+        self._discarded = 0
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if len(self._created_at) + self._opening < self.size + self.max_overflow:
+                    connection = None
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f'Не удалось получить соединение за {self.timeout} с')
+                waited = True
+                self._condition.wait(remaining)
+            self._in_use += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - start
+
+        try:
+            if connection is not None and not self._is_usable(connection):
+                # The replacement takes over the slot of the connection being closed.
+                with self._condition:
+                    self._opening += 1
+                self._close(connection)
+                connection = None
+            if connection is None:
+                connection = self._open()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    def release(self, connection):
+        with self._condition:
+            self._in_use -= 1
+            if connection in self._created_at and len(self._idle) < self.size:
+                self._idle.append(connection)
+                connection = None
+            self._condition.notify()
+        if connection is not None:
+            self._close(connection)
+
+    def discard(self, connection):
+        with self._condition:
+            self._in_use -= 1
+            self._discarded += 1
+            self._condition.notify()
+        self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            raise
+        self.release(connection)
+
+    def close(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': len(self._created_at),
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+            }
+
+    def _open(self):
+        try:
+            connection = self.factory()
+        finally:
+            with self._condition:
+                self._opening -= 1
+        with self._condition:
+            self._created_at[connection] = time.monotonic()
+        return connection
+
+    def _close(self, connection):
+        with self._condition:
+            self._created_at.pop(connection, None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, connection):
+        created_at = self._created_at.get(connection)
+        if created_at is None:
+            return False
+        if self.recycle is not None and time.monotonic() - created_at > self.recycle:
+            with self._condition:
+                self._recycled += 1
+            return False
+        if self.ping and hasattr(connection, 'ping'):
+            try:
+                connection.ping(reconnect=False)
+            except Exception:
+                with self._condition:
+                    self._discarded += 1
+                return False
+        return True
+
+
+class StatementCache:
+    def __init__(self, connection, size=32):
+        self.connection = connection
+        self.size = size
+        self._cursors = OrderedDict()
+
+    def cursor(self, query):
+        cursor = self._cursors.get(query)
+        if cursor is not None:
+            self._cursors.move_to_end(query)
+            return cursor, False
+        # A prepared cursor keeps its statement prepared on the server until it is closed.
+        cursor = self.connection.cursor(prepared=True, named_tuple=True)
+        self._cursors[query] = cursor
+        if len(self._cursors) > self.size:
+            self._cursors.popitem(last=False)[1].close()
+        return cursor, True
+
+    def __len__(self):
+        return len(self._cursors)
+
+
+class Replica:
+    def __init__(self, name, pool, probe):
+        self.name = name
+        self.pool = pool
+        # Health checks use a connection of their own, so a replica busy with reads is not taken for a dead one.
+        self.probe = probe
+        self.healthy = True
+        self.latency = None
+        self.lag = None
+        self.reads = 0
+        self.failures = 0
+        self.error = None
+        self.checked_at = None
 
 
 class DBConnector:
-    def __init__(self, app):
+    def __init__(self, app, factory=None, metrics=None):
         self.app = app
+        self.factory = factory
+        self.metrics = metrics
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.statement_cache_size = app.config.get('MYSQL_STATEMENT_CACHE_SIZE', 32)
+        self._statements = weakref.WeakKeyDictionary()
+        self._statement_counts = {}
+        self._statement_lock = threading.Lock()
+        self._replicas = None
+        self._replica_lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._read_counts = {'primary_reads': 0, 'pinned_reads': 0, 'failovers': 0}
+        self.balance = app.config.get('MYSQL_REPLICA_BALANCE', 'round_robin')
+        self.check_interval = app.config.get('MYSQL_REPLICA_CHECK_INTERVAL', 5)
+        self.max_lag = app.config.get('MYSQL_REPLICA_MAX_LAG')
+        self.read_your_writes = app.config.get('MYSQL_READ_YOUR_WRITES', 5)
         self.app.teardown_appcontext(self.disconnect)
 
     def get_config(self):
@@ -15,13 +249,276 @@ class DBConnector:
             'database': self.app.config["MYSQL_DATABASE"]
         }
 
-    def connect(self):
-        if 'db' not in g:
-            g.db = mysql.connector.connect(**self.get_config())
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = self._make_pool(self._connect)
+        return self._pool
+
+    @property
+    def replicas(self):
+        if self._replicas is None:
+            with self._pool_lock:
+                if self._replicas is None:
+                    replicas = []
+                    for entry in self.app.config.get('MYSQL_REPLICAS', ()):
+                        overrides = dict(entry) if isinstance(entry, dict) else {'host': entry}
+                        name = overrides.pop('name', overrides['host'])
+                        connect = partial(self._connect, overrides)
+                        replicas.append(Replica(name, self._make_pool(connect),
+                                                self._make_pool(connect, size=1, max_overflow=0)))
+                    self._replicas = replicas
+                    if replicas and self.check_interval:
+                        threading.Thread(target=self._run_health_checks, name='db-replica-health',
+                                         daemon=True).start()
+        return self._replicas
+
+    def connect(self, read_only=False):
+        if 'db' in g:
+            return g.db
+        if read_only:
+            if 'db_read' not in g:
+                start = time.monotonic()
+                pool, connection = self._acquire_read()
+                self._observe_wait(start)
+                if pool is self.pool:
+                    g.db = connection
+                    return connection
+                g.db_read = (pool, connection)
+            return g.db_read[1]
+        start = time.monotonic()
+        g.db = self.pool.acquire()
+        self._observe_wait(start)
         return g.db
-    
+
+    @contextmanager
+    def read_connection(self):
+        pool, connection = self._acquire_read()
+        try:
+            yield connection
+            connection.rollback()
+        except Exception:
+            pool.discard(connection)
+            raise
+        pool.release(connection)
+
+    @contextmanager
+    def primary_connection(self):
+        # Reads that must not see replica lag; reuses the request's primary connection when it has one.
+        if has_request_context() and 'db' in g:
+            yield g.db
+        else:
+            with self.pool.connection() as connection:
+                yield connection
+
+    def after_commit(self, func, *args):
+        # Caches are invalidated once the change is visible, or a concurrent read could cache the old row again.
+        g.setdefault('db_after_commit', []).append(partial(func, *args))
+
+    def commit(self, connection):
+        connection.commit()
+        for callback in g.pop('db_after_commit', ()):
+            callback()
+
+    def rollback(self, connection):
+        g.pop('db_after_commit', None)
+        connection.rollback()
+
+    def reads_pinned(self):
+        # Replicas lag behind the primary, so a session that has just written keeps reading from the primary.
+        return has_request_context() and session.get(PRIMARY_UNTIL_KEY, 0) > time.time()
+
+    def mark_written(self):
+        if self.replicas and self.read_your_writes and has_request_context():
+            session[PRIMARY_UNTIL_KEY] = time.time() + self.read_your_writes
+
+    def check_replicas(self):
+        return {replica.name: self._check(replica) for replica in self.replicas}
+
+    def replica_stats(self):
+        with self._replica_lock:
+            replicas = {replica.name: {
+                'healthy': replica.healthy,
+                'latency': replica.latency,
+                'lag': replica.lag,
+                'reads': replica.reads,
+                'failures': replica.failures,
+                'error': replica.error,
+                'checked_at': replica.checked_at,
+            } for replica in self.replicas}
+            counts = dict(self._read_counts)
+        for replica in self.replicas:
+            replicas[replica.name]['pool'] = replica.pool.stats()
+        return {
+            **counts,
+            'replica_reads': sum(item['reads'] for item in replicas.values()),
+            'healthy': sum(item['healthy'] for item in replicas.values()),
+            'unhealthy': sum(not item['healthy'] for item in replicas.values()),
+            'replicas': replicas,
+        }
+
+    def execute_prepared(self, query, params=(), connection=None):
+        connection = connection if connection is not None else self.connect()
+        with self._statement_lock:
+            cache = self._statements.get(connection)
+            if cache is None:
+                cache = self._statements[connection] = StatementCache(connection, self.statement_cache_size)
+        cursor, prepared = cache.cursor(query)
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.with_rows else []
+        with self._statement_lock:
+            counts = self._statement_counts.setdefault(normalize_sql(query), [0, 0])
+            counts[0] += 1
+            counts[1] += prepared
+        return rows
+
+    def statement_stats(self):
+        with self._statement_lock:
+            statements = {query: {'executions': executions, 'prepares': prepares}
+                          for query, (executions, prepares) in self._statement_counts.items()}
+            cached = sum(len(cache) for cache in self._statements.values())
+        executions = sum(item['executions'] for item in statements.values())
+        prepares = sum(item['prepares'] for item in statements.values())
+        return {
+            'executions': executions,
+            'prepares': prepares,
+            'reuse_ratio': 1 - prepares / executions if executions else 0.0,
+            'cached': cached,
+            'statements': statements,
+        }
+
+    def dedicated_pool(self, size):
+        # For writes made while the request still holds its connection: taking them from the shared pool would
+        # need two slots per request, and a full pool of requests would wait on each other until the timeout.
+        return self._make_pool(self._connect, size=size, max_overflow=0)
+
+    def _make_pool(self, connect, **overrides):
+        config = self.app.config
+        options = dict(
+            size=config.get('MYSQL_POOL_SIZE', 5),
+            max_overflow=config.get('MYSQL_POOL_MAX_OVERFLOW', 10),
+            timeout=config.get('MYSQL_POOL_TIMEOUT', 30),
+            recycle=config.get('MYSQL_POOL_RECYCLE', 3600),
+            ping=config.get('MYSQL_POOL_PING', True),
+        )
+        options.update(overrides)
+        return ConnectionPool(connect, **options)
+
+    def _connect(self, overrides=None):
+        if self.factory:
+            connection = self.factory()
+        else:
+            connection = connector.connect(**dict(self.get_config(), **(overrides or {})))
+        if self.metrics is not None:
+            connection = TracedConnection(connection, self.metrics)
+        return connection
+
+    def _observe_wait(self, start):
+        if self.metrics is not None:
+            self.metrics.observe_wait(time.monotonic() - start)
+
+    def _acquire_read(self):
+        if not self.replicas:
+            return self.pool, self.pool.acquire()
+        if self.reads_pinned():
+            self._count_read('pinned_reads')
+            return self.pool, self.pool.acquire()
+        for _ in self.replicas:
+            replica = self._choose_replica()
+            if replica is None:
+                break
+            try:
+                connection = replica.pool.acquire()
+            except PoolTimeoutError:
+                # A busy replica is still a working one; the primary takes this read without marking it down.
+                break
+            except Exception as error:
+                self._mark_unhealthy(replica, error)
+                continue
+            with self._replica_lock:
+                replica.reads += 1
+            return replica.pool, connection
+        self._count_read('failovers')
+        return self.pool, self.pool.acquire()
+
+    def _choose_replica(self):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.balance == 'least_latency':
+            return min(healthy, key=lambda replica: replica.latency or 0.0)
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def _count_read(self, key):
+        with self._replica_lock:
+            self._read_counts[key] += 1
+
+    def _check(self, replica):
+        lag = None
+        try:
+            with replica.probe.connection() as connection:
+                with connection.cursor(dictionary=True, buffered=True) as cursor:
+                    start = time.monotonic()
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                    latency = time.monotonic() - start
+                    if self.max_lag is not None:
+                        cursor.execute("SHOW REPLICA STATUS")
+                        status = cursor.fetchone()
+                        lag = status.get('Seconds_Behind_Source') if status else None
+                        if lag is None:
+                            raise ReplicaLagError('Репликация остановлена')
+                        if lag > self.max_lag:
+                            raise ReplicaLagError(f'Отставание реплики {lag} с')
+        except PoolTimeoutError:
+            # Another check holds the probe; its verdict stands.
+            return replica.healthy
+        except Exception as error:
+            self._mark_unhealthy(replica, error, lag)
+            return False
+        with self._replica_lock:
+            if not replica.healthy:
+                self.app.logger.info('Реплика %s снова доступна', replica.name)
+            replica.healthy = True
+            replica.error = None
+            replica.lag = lag
+            replica.latency = latency if replica.latency is None else replica.latency * 0.8 + latency * 0.2
+            replica.checked_at = time.time()
+        return True
+
+    def _mark_unhealthy(self, replica, error, lag=None):
+        with self._replica_lock:
+            if replica.healthy:
+                self.app.logger.warning('Реплика %s исключена из чтения: %s', replica.name, error)
+            replica.healthy = False
+            replica.failures += 1
+            replica.error = str(error)
+            replica.lag = lag
+            replica.checked_at = time.time()
+        replica.pool.close()
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check_replicas()
+            except Exception:
+                self.app.logger.exception('Не удалось проверить реплики')
+
     def disconnect(self, e=None):
-        if 'db' in g:
-            g.db.close()
-        g.pop('db', None)
-        
\ No newline at end of file
+        connection = g.pop('db', None)
+        if connection is not None:
+            self._return(self.pool, connection)
+        pool, connection = g.pop('db_read', (None, None))
+        if connection is not None:
+            self._return(pool, connection)
+
+    def _return(self, pool, connection):
+        try:
+            connection.rollback()
+        except Exception:
+            pool.discard(connection)
+        else:
+            pool.release(connection)
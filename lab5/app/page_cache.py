@@ -0,0 +1,135 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from markupsafe import Markup
+
+
+class PageCache:
+    def __init__(self, app):
+        self.max_bytes = app.config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        self.default_ttl = app.config.get('PAGE_CACHE_TTL', 60)
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self.counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'invalidations': 0}
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        app.jinja_env.globals['cache_fragment'] = self.fragment
+
+    def cached(self, ttl=None, tags=(), vary=None):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flashes are rendered once and must not be replayed to the next viewer.
+                if not self.enabled or request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                    return view(*args, **kwargs)
+                key = ('page', request.endpoint, request.full_path, vary() if vary else None)
+                entry = self._get(key)
+                if entry is None:
+                    versions = self._versions(tags)
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed or 'Set-Cookie' in response.headers:
+                        return response
+                    body = response.get_data()
+                    entry = (body, response.mimetype, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+                             datetime.now(timezone.utc).replace(microsecond=0))
+                    self._set(key, entry, len(body), self.default_ttl if ttl is None else ttl, tags, versions)
+                return self._respond(entry)
+
+            return wrapper
+
+        return decorator
+
+    def fragment(self, name, *key, caller, ttl=None, tags=()):
+        key = ('fragment', name) + key
+        entry = self._get(key)
+        if entry is None:
+            versions = self._versions(tags)
+            entry = str(caller())
+            self._set(key, entry, len(entry.encode()), self.default_ttl if ttl is None else ttl, tags, versions)
+        return Markup(entry)
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                        hit_ratio=self.counters['hits'] / lookups if lookups else 0.0)
+
+    def _respond(self, entry):
+        body, mimetype, etag, last_modified = entry
+        response = Response(body, mimetype=mimetype)
+        response.headers['ETag'] = etag
+        response.last_modified = last_modified
+        # Pages depend on the logged-in user, so browsers keep them private and revalidate every time.
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.counters['not_modified'] += 1
+        return response
+
+    def _get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    self._remove(key)
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return item[0]
+
+    def _versions(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _set(self, key, value, size, ttl, tags, versions=None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # A page rendered while one of its tags was invalidated may show the data from before the change.
+            if versions is not None and versions != tuple(self._generations.get(tag, 0) for tag in tags):
+                return
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size, tuple(tags))
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        self._bytes -= item[2]
+        for tag in item[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
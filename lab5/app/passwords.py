@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hashes are stored as "<name>$<params...>$<salt>$<hash>", legacy rows keep the
+# bare hex SHA2(password, 256) and are rehashed on the next successful login:
+#
+# alter table users modify password_hash varchar(255) not null;
+# create unique index users_login on users (login);
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _encode(value):
+    return base64.b64encode(value).decode()
+
+
+def _decode(value):
+    return base64.b64decode(value.encode())
+
+
+class Hasher:
+    name = None
+
+    def hash(self, password):
+        raise NotImplementedError
+
+    def verify(self, password, encoded):
+        raise NotImplementedError
+
+    def needs_rehash(self, encoded):
+        return False
+
+
+class ScryptHasher(Hasher):
+    name = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def hash(self, password, salt=None):
+        salt = salt or os.urandom(16)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return f'{self.name}${self.n}${self.r}${self.p}${_encode(salt)}${_encode(key)}'
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, key = encoded.split('$')
+        return hmac.compare_digest(self._derive(password, _decode(salt), int(n), int(r), int(p)), _decode(key))
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+class Pbkdf2Hasher(Hasher):
+    name = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def hash(self, password, salt=None):
+        salt = salt or os.urandom(16)
+        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f'{self.name}${self.iterations}${_encode(salt)}${_encode(key)}'
+
+    def verify(self, password, encoded):
+        _, iterations, salt, key = encoded.split('$')
+        derived = hashlib.pbkdf2_hmac('sha256', password.encode(), _decode(salt), int(iterations))
+        return hmac.compare_digest(derived, _decode(key))
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1] != str(self.iterations)
+
+
+class Sha256Hasher(Hasher):
+    name = 'sha256'
+
+    def hash(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.hash(password), encoded.lower())
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+class Passwords:
+    def __init__(self, app):
+        config = app.config
+        hashers = [
+            ScryptHasher(config.get('PASSWORD_SCRYPT_N', 2 ** 14), config.get('PASSWORD_SCRYPT_R', 8),
+                         config.get('PASSWORD_SCRYPT_P', 1)),
+            Pbkdf2Hasher(config.get('PASSWORD_PBKDF2_ITERATIONS', 600000)),
+        ]
+        self.hashers = {hasher.name: hasher for hasher in hashers}
+        self.hasher = self.hashers[config.get('PASSWORD_HASHER', 'scrypt')]
+        self.legacy = Sha256Hasher()
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', 10)
+        self.workers = config.get('PASSWORD_HASH_WORKERS', 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + config.get('PASSWORD_HASH_QUEUE', 32))
+
+    def hash(self, password):
+        return self._run(self.hasher.hash, password)
+
+    def hash_many(self, passwords):
+        # At most `workers` hashes in flight, so bulk jobs leave queue slots for logins.
+        hashes = []
+        for start in range(0, len(passwords), self.workers):
+            futures = [self._submit(self.hasher.hash, password) for password in passwords[start:start + self.workers]]
+            hashes.extend(future.result() for future in futures)
+        return hashes
+
+    def verify(self, password, encoded):
+        if not encoded:
+            # Unknown logins cost as much as known ones.
+            self._run(self.hasher.hash, password)
+            return False, None
+        hasher = self.hashers.get(encoded.split('$', 1)[0], self.legacy)
+        if not self._run(hasher.verify, password, encoded):
+            return False, None
+        if hasher is not self.hasher or hasher.needs_rehash(encoded):
+            return True, self.hash(password)
+        return True, None
+
+    def _run(self, function, *args):
+        return self._submit(function, *args).result()
+
+    def _submit(self, function, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
@@ -0,0 +1,94 @@
+import threading
+import time
+
+
+class Snapshot:
+    def __init__(self, rows, version):
+        self.rows = tuple(rows)
+        self.by_id = {row.id: row for row in self.rows}
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, row_id, default=None):
+        return self.by_id.get(row_id, default)
+
+
+class ReferenceData:
+    def __init__(self, app, db_connector):
+        self.app = app
+        self.db_connector = db_connector
+        self.check_interval = app.config.get('REFDATA_CHECK_INTERVAL', 60)
+        self.counters = {'loads': 0, 'checks': 0, 'failures': 0, 'invalidations': 0}
+        self._tables = {}
+        self._snapshots = {}
+        self._load_lock = threading.Lock()
+        self._checking = threading.Lock()
+        self._lock = threading.Lock()
+
+    def register(self, name, query, version_query):
+        self._tables[name] = (query, version_query)
+
+    def preload(self):
+        for name in self._tables:
+            try:
+                self.load(name)
+            except Exception as error:
+                # The table is then loaded by its first get().
+                self._count('failures')
+                self.app.logger.warning('Не удалось загрузить справочник %s при запуске: %s', name, error)
+
+    def get(self, name):
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            return self.load(name)
+        if snapshot.checked_at + self.check_interval < time.monotonic() and self._checking.acquire(blocking=False):
+            threading.Thread(target=self._check, args=(name, snapshot), daemon=True).start()
+        return snapshot
+
+    def load(self, name):
+        query, version_query = self._tables[name]
+        with self._load_lock:
+            with self.db_connector.pool.connection() as connection:
+                with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                    cursor.execute(version_query)
+                    version = cursor.fetchall()
+                    cursor.execute(query)
+                    snapshot = Snapshot(cursor.fetchall(), version)
+            self._snapshots[name] = snapshot
+        self._count('loads')
+        return snapshot
+
+    def invalidate(self, name=None):
+        for key in [name] if name is not None else list(self._snapshots):
+            self._snapshots.pop(key, None)
+        self._count('invalidations')
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, tables=len(self._snapshots))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _check(self, name, snapshot):
+        try:
+            self._count('checks')
+            with self.db_connector.pool.connection() as connection:
+                with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                    cursor.execute(self._tables[name][1])
+                    version = cursor.fetchall()
+            if version != snapshot.version:
+                self.load(name)
+        except Exception:
+            self._count('failures')
+            self.app.logger.exception('Не удалось проверить справочник %s', name)
+        finally:
+            snapshot.checked_at = time.monotonic()
+            self._checking.release()
@@ -0,0 +1,241 @@
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from rollups import ARCHIVED_BUCKET, ROLLUPS, STATE_NAME, rollup_query
+
+# alter table rollup_state
+#     add column purged_action_id int not null default 0,
+#     add column purged_before datetime null;
+#
+# Actions older than RETENTION_DAYS leave user_actions in id windows of RETENTION_BATCH_SIZE,
+# each in its own short transaction: the window is written to a gzip CSV in the archive directory,
+# counted into the ARCHIVED_BUCKET rollup rows and deleted. Only the rows of the window are locked,
+# and only actions the rollups have already counted are removed.
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'path', 'created_at')
+
+
+class RetentionError(Exception):
+    pass
+
+
+class Retention:
+    def __init__(self, app, db_connector, rollups):
+        self.app = app
+        self.db_connector = db_connector
+        self.rollups = rollups
+        self.days = app.config.get('RETENTION_DAYS', 180)
+        self.batch_size = app.config.get('RETENTION_BATCH_SIZE', 5000)
+        self.pause = app.config.get('RETENTION_PAUSE', 0.1)
+        self.archive_dir = app.config.get('RETENTION_ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+        app.cli.add_command(self._commands())
+
+    def cutoff(self, days=None):
+        # Whole days, so an hour or day rollup bucket is never split between the table and the archive.
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=self.days if days is None else days)
+
+    def purge(self, days=None, dry_run=False):
+        if not self.rollups.bucket:
+            raise RetentionError('Без ROLLUP_BUCKET статистика за период считается по user_actions, '
+                                 'удалять из неё действия нельзя')
+        cutoff = self.cutoff(days)
+        report = {'cutoff': cutoff, 'actions': 0, 'batches': 0, 'files': 0}
+        self.rollups.refresh()
+        with self.db_connector.pool.connection() as connection:
+            with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                cursor.execute("SELECT last_action_id, purged_action_id FROM rollup_state WHERE name = %s",
+                               (STATE_NAME,))
+                state = cursor.fetchone()
+                cursor.execute("SELECT MAX(id) AS upto FROM user_actions WHERE id > %s AND created_at < %s",
+                               (state.purged_action_id, cutoff))
+                upto = cursor.fetchone().upto
+                if upto is None:
+                    return report
+                if upto > state.last_action_id:
+                    raise RetentionError(f'Агрегаты учли действия только до id {state.last_action_id}, '
+                                         f'а удалять нужно до {upto}')
+                if dry_run:
+                    cursor.execute("SELECT COUNT(*) AS count FROM user_actions "
+                                   "WHERE id > %s AND id <= %s AND created_at < %s",
+                                   (state.purged_action_id, upto, cutoff))
+                    report['actions'] = cursor.fetchone().count
+                    return report
+            connection.commit()
+            while self._purge_batch(connection, cutoff, upto, report):
+                time.sleep(self.pause)
+        return report
+
+    def status(self):
+        with self.db_connector.pool.connection() as connection:
+            with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                cursor.execute("SELECT purged_action_id, purged_before FROM rollup_state WHERE name = %s",
+                               (STATE_NAME,))
+                state = cursor.fetchone()
+                cursor.execute("SELECT COUNT(*) AS count, MIN(created_at) AS oldest FROM user_actions")
+                table = cursor.fetchone()
+        files = self._load_manifest()
+        return {
+            'purged_action_id': state.purged_action_id,
+            'purged_before': state.purged_before,
+            'actions': table.count,
+            'oldest_action': table.oldest,
+            'archive_files': len(files),
+            'archived_actions': sum(item['rows'] for item in files.values()),
+            'archive_bytes': sum(item['bytes'] for item in files.values()),
+            'archive_range': (min((item['start'] for item in files.values()), default=None),
+                              max((item['end'] for item in files.values()), default=None)),
+        }
+
+    def iter_archive(self, start=None, end=None, user_id=None, path=None):
+        files = sorted(self._load_manifest().items(), key=lambda item: (item[1]['first_id'], item[1]['last_id']))
+        last_id = 0
+        for name, item in files:
+            if (start is not None and item['end'] < start.isoformat(' ')
+                    or end is not None and item['start'] >= end.isoformat(' ')):
+                continue
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8', newline='') as file:
+                for row in csv.DictReader(file):
+                    action_id = int(row['id'])
+                    # A window archived by a purge that crashed before commit is archived again by the next one.
+                    if action_id <= last_id:
+                        continue
+                    last_id = action_id
+                    created_at = datetime.fromisoformat(row['created_at'])
+                    if start is not None and created_at < start or end is not None and created_at >= end:
+                        continue
+                    if user_id is not None and row['user_id'] != ('' if user_id == 0 else str(user_id)):
+                        continue
+                    if path is not None and row['path'] != path:
+                        continue
+                    yield {'id': action_id, 'user_id': int(row['user_id']) if row['user_id'] else None,
+                           'path': row['path'], 'created_at': created_at}
+
+    def _purge_batch(self, connection, cutoff, upto, report):
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            cursor.execute("SELECT purged_action_id FROM rollup_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+            start = cursor.fetchone().purged_action_id
+            if start >= upto:
+                cursor.execute("UPDATE rollup_state SET purged_before = GREATEST(COALESCE(purged_before, %s), %s) "
+                               "WHERE name = %s", (cutoff, cutoff, STATE_NAME))
+                connection.commit()
+                return False
+            end = min(upto, start + self.batch_size)
+            window = (start, end, cutoff)
+            condition = "id > %s AND id <= %s AND created_at < %s"
+            cursor.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM user_actions WHERE {condition} ORDER BY id",
+                           window)
+            rows = cursor.fetchall()
+            name = None
+            try:
+                if rows:
+                    name = self._archive(start, end, rows)
+                    for table in ROLLUPS:
+                        cursor.execute(rollup_query(table, f"CAST('{ARCHIVED_BUCKET}' AS DATETIME)", condition),
+                                       window)
+                    cursor.execute(f"DELETE FROM user_actions WHERE {condition}", window)
+                cursor.execute("UPDATE rollup_state SET purged_action_id = %s WHERE name = %s", (end, STATE_NAME))
+                connection.commit()
+            except Exception:
+                if name is not None:
+                    self._discard(name)
+                raise
+        report['actions'] += len(rows)
+        report['batches'] += 1
+        report['files'] += bool(rows)
+        return True
+
+    def _archive(self, start, end, rows):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = f'user_actions-{start + 1:010d}-{end:010d}.csv.gz'
+        path = os.path.join(self.archive_dir, name)
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(ARCHIVE_COLUMNS)
+            writer.writerows(rows)
+        files = self._load_manifest()
+        files[name] = {
+            'first_id': start + 1,
+            'last_id': end,
+            'start': min(row.created_at for row in rows).isoformat(' '),
+            'end': max(row.created_at for row in rows).isoformat(' '),
+            'rows': len(rows),
+            'bytes': os.path.getsize(path),
+        }
+        self._save_manifest(files)
+        return name
+
+    def _discard(self, name):
+        files = self._load_manifest()
+        files.pop(name, None)
+        self._save_manifest(files)
+        try:
+            os.remove(os.path.join(self.archive_dir, name))
+        except OSError:
+            pass
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.archive_dir, 'manifest.json')) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _save_manifest(self, files):
+        path = os.path.join(self.archive_dir, 'manifest.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(files, file, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def _commands(self):
+        group = AppGroup('retention', help='Срок хранения и архив user_actions.')
+
+        @group.command('purge')
+        @click.option('--days', type=int, help='Сколько дней хранить, по умолчанию RETENTION_DAYS')
+        @click.option('--dry-run', is_flag=True, help='Только посчитать, сколько действий будет удалено')
+        def purge_command(days, dry_run):
+            try:
+                report = self.purge(days, dry_run)
+            except RetentionError as error:
+                raise click.ClickException(str(error))
+            if dry_run:
+                click.echo(f"Будет перенесено в архив действий до {report['cutoff']:%Y-%m-%d}: {report['actions']}")
+                return
+            click.echo(f"Перенесено в архив действий до {report['cutoff']:%Y-%m-%d}: {report['actions']}, "
+                       f"пакетов: {report['batches']}, файлов: {report['files']}")
+
+        @group.command('status')
+        def status_command():
+            for key, value in self.status().items():
+                click.echo(f'{key}: {value}')
+
+        @group.command('query')
+        @click.option('--from', 'start', type=click.DateTime(), help='Начало периода (включительно)')
+        @click.option('--to', 'end', type=click.DateTime(), help='Конец периода (не включительно)')
+        @click.option('--user-id', type=int, help='0 для неавторизованных пользователей')
+        @click.option('--path')
+        @click.option('--group-by', type=click.Choice(('path', 'user_id', 'day')),
+                      help='Вместо строк вывести число действий по группам')
+        @click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+        def query_command(start, end, user_id, path, group_by, output):
+            actions = self.iter_archive(start, end, user_id, path)
+            writer = csv.writer(output)
+            if group_by is None:
+                writer.writerow(ARCHIVE_COLUMNS)
+                writer.writerows([action[column] for column in ARCHIVE_COLUMNS] for action in actions)
+                return
+            counts = {}
+            for action in actions:
+                key = action['created_at'].date() if group_by == 'day' else action[group_by]
+                counts[key] = counts.get(key, 0) + 1
+            writer.writerow((group_by, 'visits'))
+            writer.writerows(sorted(counts.items(), key=lambda item: (item[0] is None, str(item[0]))))
+
+        return group
@@ -0,0 +1,265 @@
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+
+# create table user_visit_rollup (
+#     user_id int not null,
+#     bucket datetime not null,
+#     visits bigint not null,
+#     primary key (user_id, bucket)
+# ) engine innodb;
+#
+# create table path_visit_rollup (
+#     path varchar(100) not null,
+#     bucket datetime not null,
+#     visits bigint not null,
+#     primary key (path, bucket),
+#     key path_visit_rollup_bucket_visits (bucket, visits)
+# ) engine innodb;
+#
+# create table rollup_state (
+#     name varchar(50) primary key,
+#     last_action_id int not null default 0,
+#     pending_action_id int not null default 0,
+#     purged_action_id int not null default 0,
+#     purged_before datetime null
+# ) engine innodb;
+#
+# insert into rollup_state (name) values ('user_actions');
+#
+# Anonymous visits are counted under user_id = 0. Every action is added both to
+# the all-time TOTAL_BUCKET row and, if ROLLUP_BUCKET is set, to its hour/day row.
+# Actions removed from user_actions by retention are also counted in ARCHIVED_BUCKET,
+# so that rebuild and check can tell them apart from the rows still in the table.
+
+TOTAL_BUCKET = '1000-01-01 00:00:00'
+ARCHIVED_BUCKET = '1000-01-02 00:00:00'
+STATE_NAME = 'user_actions'
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400}
+BUCKET_EXPRESSIONS = {
+    'hour': "DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:00:00')",
+    'day': "CAST(DATE(created_at) AS DATETIME)",
+}
+ROLLUPS = {
+    'user_visit_rollup': ('user_id', 'COALESCE(user_id, 0)'),
+    'path_visit_rollup': ('path', 'path'),
+}
+
+
+class RangeError(ValueError):
+    pass
+
+
+def rollup_query(table, bucket, condition):
+    column, expression = ROLLUPS[table]
+    return (f"INSERT INTO {table} ({column}, bucket, visits) "
+            f"SELECT * FROM (SELECT {expression} AS {column}, {bucket} AS bucket, COUNT(*) AS visits "
+            f"FROM user_actions WHERE {condition} GROUP BY 1, 2) AS batch "
+            f"ON DUPLICATE KEY UPDATE visits = {table}.visits + batch.visits")
+
+
+class Rollups:
+    def __init__(self, app, db_connector):
+        self.app = app
+        self.db_connector = db_connector
+        self.bucket = app.config.get('ROLLUP_BUCKET', 'day')
+        self.batch_size = app.config.get('ROLLUP_BATCH_SIZE', 50000)
+        self.interval = app.config.get('ROLLUP_INTERVAL', 10)
+        self._purged_before = None
+        self._state_loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        app.cli.add_command(self._commands())
+
+    @property
+    def purged_before(self):
+        # Retention may have archived actions before this process started. Until the first refresh reads the
+        # state, it is loaded here; otherwise archived ranges would be counted from what is left in user_actions.
+        if not self._state_loaded:
+            with self.db_connector.primary_connection() as connection:
+                with connection.cursor(named_tuple=True, buffered=True) as cursor:
+                    cursor.execute("SELECT purged_before FROM rollup_state WHERE name = %s", (STATE_NAME,))
+                    self.purged_before = cursor.fetchone().purged_before
+        return self._purged_before
+
+    @purged_before.setter
+    def purged_before(self, value):
+        self._purged_before = value
+        self._state_loaded = True
+
+    def schedule_refresh(self):
+        # Called by the action log writer: catching up can take many batches, so it runs on a thread of its own.
+        self._start_worker()
+        self._wakeup.set()
+
+    def refresh(self):
+        processed = 0
+        with self.db_connector.pool.connection() as connection:
+            while True:
+                count = self._refresh_batch(connection)
+                if not count:
+                    return processed
+                processed += count
+
+    def rebuild(self):
+        with self.db_connector.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT purged_before FROM rollup_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+                purged_before = cursor.fetchone()[0]
+                for table, (column, _) in ROLLUPS.items():
+                    if purged_before is None:
+                        cursor.execute(f"DELETE FROM {table}")
+                        continue
+                    # Archived actions are no longer in user_actions: their buckets are kept as they are
+                    # and the totals start from what was archived.
+                    cursor.execute(f"DELETE FROM {table} WHERE bucket = %s OR bucket >= %s",
+                                   (TOTAL_BUCKET, purged_before))
+                    cursor.execute(f"INSERT INTO {table} ({column}, bucket, visits) "
+                                   f"SELECT {column}, %s, visits FROM {table} WHERE bucket = %s",
+                                   (TOTAL_BUCKET, ARCHIVED_BUCKET))
+                cursor.execute("UPDATE rollup_state SET last_action_id = 0, "
+                               "pending_action_id = (SELECT COALESCE(MAX(id), 0) FROM user_actions) "
+                               "WHERE name = %s", (STATE_NAME,))
+            connection.commit()
+        return self.refresh()
+
+    def check(self):
+        mismatches = []
+        with self.db_connector.pool.connection() as connection:
+            with connection.cursor(buffered=True) as cursor:
+                cursor.execute("SELECT last_action_id FROM rollup_state WHERE name = %s", (STATE_NAME,))
+                last_action_id = cursor.fetchone()[0]
+                for table, (column, expression) in ROLLUPS.items():
+                    cursor.execute(f"SELECT {expression}, COUNT(*) FROM user_actions "
+                                   f"WHERE id <= %s GROUP BY 1", (last_action_id,))
+                    raw = dict(cursor.fetchall())
+                    cursor.execute(f"SELECT {column}, SUM(IF(bucket = %s, visits, -visits)) FROM {table} "
+                                   "WHERE bucket IN (%s, %s) GROUP BY 1", (TOTAL_BUCKET, TOTAL_BUCKET, ARCHIVED_BUCKET))
+                    rolled = {key: int(visits) for key, visits in cursor.fetchall() if visits}
+                    for key in raw.keys() | rolled.keys():
+                        if raw.get(key, 0) != rolled.get(key, 0):
+                            mismatches.append((table, key, raw.get(key, 0), rolled.get(key, 0)))
+        return mismatches
+
+    def get_user_stats(self, cursor):
+        cursor.execute(*self.user_stats_query())
+        return cursor.fetchall()
+
+    def get_page_stats(self, cursor):
+        cursor.execute(*self.page_stats_query())
+        return cursor.fetchall()
+
+    def user_stats_query(self, start=None, end=None):
+        counts, params = self._counts_query('user_visit_rollup', start, end)
+        return ("SELECT NULLIF(counts.user_id, 0) AS user_id, last_name, first_name, middle_name, "
+                "counts.visits AS entries_counter "
+                f"FROM ({counts}) AS counts LEFT JOIN users ON counts.user_id = users.id "
+                "ORDER BY counts.user_id"), params
+
+    def page_stats_query(self, start=None, end=None):
+        counts, params = self._counts_query('path_visit_rollup', start, end)
+        return f"SELECT path, visits AS visits_count FROM ({counts}) AS counts ORDER BY visits DESC", params
+
+    def _counts_query(self, table, start, end):
+        column, expression = ROLLUPS[table]
+        if start is None and end is None:
+            return f"SELECT {column}, visits FROM {table} WHERE bucket = %s", (TOTAL_BUCKET,)
+        if self.bucket and self.aligned(start, end):
+            source, key, visits, time_column = table, column, 'SUM(visits)', 'bucket'
+            conditions, params = ["bucket > %s"], [ARCHIVED_BUCKET]
+        else:
+            # Buckets cannot be split, so a range that does not fall on their boundaries is counted exactly.
+            if self.purged_before is not None and (start is None or start < self.purged_before):
+                raise RangeError(f'Действия до {self.purged_before:%Y-%m-%d} перенесены в архив, '
+                                 'для этого периода доступны только границы агрегатов')
+            source, key, visits, time_column = 'user_actions', expression, 'COUNT(*)', 'created_at'
+            conditions, params = [], []
+        if start is not None:
+            conditions.append(f"{time_column} >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{time_column} < %s")
+            params.append(end)
+        return (f"SELECT {key} AS {column}, {visits} AS visits FROM {source} "
+                f"WHERE {' AND '.join(conditions)} GROUP BY 1"), tuple(params)
+
+    def aligned(self, *moments):
+        seconds = BUCKET_SECONDS[self.bucket]
+        for moment in moments:
+            if moment is not None and (moment - datetime(1970, 1, 1, tzinfo=moment.tzinfo)).total_seconds() % seconds:
+                return False
+        return True
+
+    def _refresh_batch(self, connection):
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            cursor.execute("SELECT last_action_id, pending_action_id, purged_before FROM rollup_state "
+                           "WHERE name = %s FOR UPDATE", (STATE_NAME,))
+            state = cursor.fetchone()
+            self.purged_before = state.purged_before
+            if state.last_action_id >= state.pending_action_id:
+                # Rows up to the current maximum are picked up on the next refresh,
+                # so that transactions still holding lower ids have time to commit.
+                cursor.execute("UPDATE rollup_state SET pending_action_id = "
+                               "(SELECT COALESCE(MAX(id), 0) FROM user_actions) WHERE name = %s", (STATE_NAME,))
+                connection.commit()
+                return 0
+            upto = min(state.pending_action_id, state.last_action_id + self.batch_size)
+            for query in self._rollup_queries():
+                cursor.execute(query, (state.last_action_id, upto))
+            cursor.execute("UPDATE rollup_state SET last_action_id = %s WHERE name = %s", (upto, STATE_NAME))
+        connection.commit()
+        return upto - state.last_action_id
+
+    def _start_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='rollups', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(max(self._last_refresh + self.interval - time.monotonic(), 0))
+            self._wakeup.clear()
+            self._last_refresh = time.monotonic()
+            try:
+                self.refresh()
+            except Exception:
+                self.app.logger.exception('Не удалось обновить агрегаты посещений')
+
+    def _rollup_queries(self):
+        buckets = [f"CAST('{TOTAL_BUCKET}' AS DATETIME)"]
+        if self.bucket:
+            buckets.append(BUCKET_EXPRESSIONS[self.bucket])
+        for table in ROLLUPS:
+            for bucket in buckets:
+                yield rollup_query(table, bucket, "id > %s AND id <= %s")
+
+    def _commands(self):
+        group = AppGroup('rollups', help='Агрегаты посещений по пользователям и страницам.')
+
+        @group.command('refresh')
+        def refresh_command():
+            click.echo(f'Обработано действий: {self.refresh()}')
+
+        @group.command('rebuild')
+        def rebuild_command():
+            click.echo(f'Обработано действий: {self.rebuild()}')
+
+        @group.command('check')
+        def check_command():
+            mismatches = self.check()
+            for table, key, raw, rolled in mismatches:
+                click.echo(f'{table}: {key!r} user_actions={raw} rollup={rolled}')
+            if mismatches:
+                raise SystemExit(1)
+            click.echo('Агрегаты совпадают с user_actions')
+
+        return group
@@ -0,0 +1,334 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import session as current_session
+from flask.cli import AppGroup
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_loaded_from_cookie, user_logged_in, user_logged_out
+from werkzeug.datastructures import CallbackDict
+
+# create table sessions (
+#     id char(43) primary key,
+#     data blob not null,
+#     expires_at double not null,
+#     key sessions_expires_at (expires_at)
+# ) engine innodb;
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+"""
+SWEEP_BATCH_SIZE = 1000
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, raw=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.raw = raw
+        self.expires_at = expires_at
+        self.stale_sid = None
+        self.modified = False
+        self.accessed = False
+
+    @property
+    def new(self):
+        return self.raw is None
+
+    def regenerate(self):
+        if self.stale_sid is None and self.raw is not None:
+            self.stale_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.raw = None
+        self.modified = True
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class MemoryStore:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            item = self._entries.get(sid)
+            if item is None or item[1] < time.time():
+                return None
+            self._entries.move_to_end(sid)
+            return item
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            item = self._entries.get(sid)
+            if item is not None:
+                self._entries[sid] = (item[0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [sid for sid, item in self._entries.items() if item[1] < now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def load(self, sid):
+        row = self._connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at >= ?", (sid, time.time())).fetchone()
+        return tuple(row) if row is not None else None
+
+    def save(self, sid, data, expires_at):
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                               (sid, data, expires_at))
+
+    def touch(self, sid, expires_at):
+        with self._connection() as connection:
+            connection.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, sid))
+
+    def delete(self, sid):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+    def sweep(self, now):
+        with self._connection() as connection:
+            return connection.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+class MySQLStore:
+    def __init__(self, db_connector, pool_size=2):
+        self.db_connector = db_connector
+        # Never the request's g.db: committing a session write there would also commit what the view left pending.
+        self.pool = db_connector.dedicated_pool(pool_size)
+
+    def load(self, sid):
+        with self._connection() as connection:
+            rows = self.db_connector.execute_prepared(
+                "SELECT data, expires_at FROM sessions WHERE id = %s AND expires_at >= %s", (sid, time.time()),
+                connection)
+        return (bytes(rows[0].data), rows[0].expires_at) if rows else None
+
+    def save(self, sid, data, expires_at):
+        self._write("INSERT INTO sessions (id, data, expires_at) VALUES (%s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE data = VALUES(data), expires_at = VALUES(expires_at)",
+                    (sid, data, expires_at))
+
+    def touch(self, sid, expires_at):
+        self._write("UPDATE sessions SET expires_at = %s WHERE id = %s", (expires_at, sid))
+
+    def delete(self, sid):
+        self._write("DELETE FROM sessions WHERE id = %s", (sid,))
+
+    def sweep(self, now):
+        removed = 0
+        while True:
+            count = self._write(f"DELETE FROM sessions WHERE expires_at < %s LIMIT {SWEEP_BATCH_SIZE}", (now,))
+            removed += max(count, 0)
+            if count < SWEEP_BATCH_SIZE:
+                return removed
+
+    def _write(self, query, params):
+        with self._connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                count = cursor.rowcount
+            connection.commit()
+        return count
+
+    def _connection(self):
+        return self.pool.connection()
+
+
+class ServerSessions(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app, db_connector=None):
+        self.app = app
+        self.store = self._make_store(app, db_connector)
+        self.lifetime = app.config.get('SESSION_LIFETIME', timedelta(days=1))
+        self.sweep_interval = app.config.get('SESSION_SWEEP_INTERVAL', 300)
+        self.counters = {'loaded': 0, 'missing': 0, 'created': 0, 'saved': 0, 'unchanged': 0, 'touched': 0,
+                         'deleted': 0, 'rotated': 0, 'swept': 0, 'failures': 0}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        app.session_interface = self
+        app.cli.add_command(self._commands())
+        # An id that was planted or seen before the user signed in or out must not carry over to the new identity.
+        for signal in (user_logged_in, user_logged_out, user_loaded_from_cookie):
+            signal.connect(self._rotate, app)
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        item = None
+        if sid:
+            try:
+                item = self.store.load(sid)
+            except Exception:
+                self._count('failures')
+                app.logger.exception('Не удалось загрузить сессию')
+        if item is None:
+            self._count('missing' if sid else 'created')
+            return ServerSession(sid=secrets.token_urlsafe(32))
+        self._count('loaded')
+        data, expires_at = item
+        return ServerSession(self.serializer.loads(data.decode()), sid=sid, raw=data, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.stale_sid is not None:
+            self.store.delete(session.stale_sid)
+            self._count('rotated')
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                self._count('deleted')
+            if not session.new or session.stale_sid is not None:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        lifetime = self._lifetime(app, session).total_seconds()
+        now = time.time()
+        expires_at = now + lifetime
+        # Sliding expiry is extended at most once per half lifetime, not on every request.
+        refresh = session.new or session.expires_at - now < lifetime / 2
+        data = None
+        if session.modified:
+            data = self.serializer.dumps(dict(session)).encode()
+            # Reassigning the same value marks the session modified but leaves nothing to write.
+            if data == session.raw:
+                data = None
+                self._count('unchanged')
+        if data is not None:
+            self.store.save(session.sid, data, expires_at)
+            self._count('saved')
+        elif refresh:
+            self.store.touch(session.sid, expires_at)
+            self._count('touched')
+        else:
+            return
+        if session.new or refresh and session.permanent:
+            response.set_cookie(name, session.sid, expires=self._cookie_expires(app, session, expires_at),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def sweep(self):
+        removed = self.store.sweep(time.time())
+        self._count('swept', removed)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, store=type(self.store).__name__)
+        if isinstance(self.store, MySQLStore):
+            stats['pool'] = self.store.pool.stats()
+        return stats
+
+    def _rotate(self, app, **extra):
+        current_session.regenerate()
+
+    def _lifetime(self, app, session):
+        return app.permanent_session_lifetime if session.permanent else self.lifetime
+
+    def _cookie_expires(self, app, session, expires_at):
+        if not session.permanent:
+            return None
+        return datetime.fromtimestamp(expires_at, timezone.utc)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _make_store(self, app, db_connector):
+        kind = app.config.get('SESSION_STORE', 'memory')
+        if kind == 'memory':
+            return MemoryStore(app.config.get('SESSION_MEMORY_SIZE', 10000))
+        if kind == 'sqlite':
+            return SQLiteStore(app.config.get('SESSION_SQLITE_PATH') or
+                               os.path.join(app.instance_path, 'sessions.sqlite3'))
+        if kind == 'mysql':
+            if db_connector is None:
+                raise ValueError('Для SESSION_STORE = "mysql" нужен db_connector')
+            return MySQLStore(db_connector, app.config.get('SESSION_POOL_SIZE', 2))
+        raise ValueError(f'Неизвестное хранилище сессий: {kind}')
+
+    def _start_sweeper(self):
+        if self._sweeper is not None or not self.sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._run_sweeper, name='session-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _run_sweeper(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                self._count('failures')
+                self.app.logger.exception('Не удалось удалить просроченные сессии')
+
+    def _commands(self):
+        group = AppGroup('sessions', help='Серверные сессии.')
+
+        @group.command('sweep')
+        def sweep_command():
+            click.echo(f'Удалено просроченных сессий: {self.sweep()}')
+
+        return group
@@ -1,11 +1,18 @@
-from io import BytesIO
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+from functools import partial
 from math import ceil
 
-from flask import Blueprint, render_template, request, send_file
+from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import current_user, login_required
 
-from app import db_operation
+from analytics import AnalyticsError
 from auto import check_for_privelege
+from exports import csv_response, iter_rows
+from extensions import action_counts, analytics, async_db_operation, cached, db_connector, in_db_executor, rollups
+from rollups import RangeError
 
 # create table user_actions (
 #     id int primary key auto_increment,
@@ -14,117 +21,214 @@ from auto import check_for_privelege
 #     created_at timestamp default current_timestamp,
 #     foreign key (user_id) references users(id)
 # ) engine innodb
+#
+# create index user_actions_created_at_id on user_actions (created_at, id);
+# create index user_actions_user_id_created_at_id on user_actions (user_id, created_at, id);
 
 bp = Blueprint('user_actions', __name__, url_prefix='/user_actions')
 MAX_PER_PAGE = 10
 
 
+def encode_cursor(action):
+    value = json.dumps([action.created_at.isoformat(), action.id])
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        created_at, action_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.fromisoformat(created_at), int(action_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def count_actions(connector, condition, params, limit):
+    query = ("SELECT COUNT(*) AS count FROM "
+             f"(SELECT 1 FROM user_actions {condition} LIMIT %s) AS limited")
+    with connector.read_connection() as connection:
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            cursor.execute(query, params + (limit,))
+            return cursor.fetchone().count
+
+
+def fetch_all(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
 @bp.route('/')
-@db_operation
-def index(cursor):
+@async_db_operation(read_only=True)
+async def index(run):
     page = request.args.get('page', 1, type=int)
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
     user_id = current_user.get_id()
     is_admin = current_user.is_authenticated and current_user.is_admin()
     is_authenticated = current_user.is_authenticated
+    max_offset_pages = current_app.config['USER_ACTIONS_MAX_OFFSET_PAGES']
 
-    base_query = ("SELECT last_name, first_name, middle_name, "
-                  "path, user_actions.created_at AS created_at "
-                  "FROM user_actions LEFT JOIN users ON user_actions.user_id = users.id ")
+    conditions = []
     params = ()
-    count_query_condition = ""
-
     if is_authenticated:
         if not is_admin:
-            base_query += "WHERE user_actions.user_id = %s "
-            count_query_condition = "WHERE user_id = %s"
-            params = (user_id,)
+            conditions.append("user_actions.user_id = %s")
+            params = (int(user_id),)
     else:
-        base_query += "WHERE user_actions.user_id is null "
-        count_query_condition = "WHERE user_id is null"
-
-    query_limit = base_query + "LIMIT %s OFFSET %s"
-    cursor.execute(query_limit, params + (MAX_PER_PAGE, (page - 1) * MAX_PER_PAGE))
-    actions = cursor.fetchall()
-
-    count_query = "SELECT COUNT(*) as count FROM user_actions " + count_query_condition
-    cursor.execute(count_query, params if params else ())
-    record_count = cursor.fetchone().count
-
-    page_count = ceil(record_count / MAX_PER_PAGE)
-    pages = range(max(1, page - 3), min(page_count, page + 3) + 1)
+        conditions.append("user_actions.user_id is null")
+    count_condition = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    count_params = params
+
+    query = ("SELECT user_actions.id AS id, last_name, first_name, middle_name, "
+             "path, user_actions.created_at AS created_at "
+             "FROM user_actions LEFT JOIN users ON user_actions.user_id = users.id ")
+    seek = after or before
+    if seek:
+        page = None
+        operator = '<' if after else '>'
+        conditions.append(f"(user_actions.created_at {operator} %s OR "
+                          f"(user_actions.created_at = %s AND user_actions.id {operator} %s))")
+        params += (seek[0], seek[0], seek[1])
+    if conditions:
+        query += "WHERE " + " AND ".join(conditions) + " "
+    query += "ORDER BY user_actions.created_at {0}, user_actions.id {0} LIMIT %s".format('ASC' if before else 'DESC')
+    params += (MAX_PER_PAGE + 1,)
+    if page is not None:
+        page = min(max(page, 1), max_offset_pages)
+        query += " OFFSET %s"
+        params += ((page - 1) * MAX_PER_PAGE,)
+
+    if page is not None:
+        count_key = (count_condition, count_params)
+        # A stale count is refreshed on a thread of its own, outside the request, so the loader is given
+        # the connector and the limit instead of looking them up.
+        count_loader = partial(count_actions, db_connector._get_current_object(), count_condition, count_params,
+                               max_offset_pages * MAX_PER_PAGE + 1)
+        actions, record_count = await asyncio.gather(
+            run(fetch_all, query, params), in_db_executor(action_counts.get, count_key, count_loader))
+    else:
+        actions, record_count = await run(fetch_all, query, params), 0
+    has_more = len(actions) > MAX_PER_PAGE
+    actions = actions[:MAX_PER_PAGE]
+    if before:
+        actions.reverse()
+
+    prev_cursor, next_cursor = None, None
+    if actions:
+        if after or (before and has_more):
+            prev_cursor = encode_cursor(actions[0])
+        if before or has_more:
+            next_cursor = encode_cursor(actions[-1])
+
+    page_count, pages = 0, range(0)
+    if page is not None:
+        page_count = max(min(ceil(record_count / MAX_PER_PAGE), max_offset_pages), page)
+        pages = range(max(1, page - 3), min(page_count, page + 3) + 1)
+        if page < page_count:
+            next_cursor = None
 
     return render_template("user_actions/index.html", user_actions=actions,
-                           page=page, pages=pages, page_count=page_count)
+                           page=page, pages=pages, page_count=page_count,
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 
 @bp.route('users_stats')
-@db_operation
 @login_required
 @check_for_privelege('read_statistics')
-def users_stats(cursor):
-    query = ("SELECT user_id, last_name, first_name, middle_name, "
-             "COUNT(*) AS entries_counter "
-             "FROM user_actions LEFT JOIN users ON user_actions.user_id = users.id "
-             "GROUP BY user_id ")
-    cursor.execute(query)
-    users_stats = cursor.fetchall()
+@async_db_operation(read_only=True)
+async def users_stats(run):
+    users_stats = await run(rollups.get_user_stats)
 
     return render_template("user_actions/users_stats.html", users_stats=users_stats)
 
 
 @bp.route('user_export.csv')
-@db_operation
 @login_required
 @check_for_privelege('read_statistics')
-def user_export(cursor):
-    query = ("SELECT user_id, last_name, first_name, middle_name, "
-             "COUNT(*) AS entries_counter "
-             "FROM user_actions LEFT JOIN users ON user_actions.user_id = users.id "
-             "GROUP BY user_id ")
-    cursor.execute(query)
-    print(cursor.statement)
-    users_stats = cursor.fetchall()
-    result = ''
-    fields = ['last_name', 'first_name', 'middle_name', 'entries_counter']
+def user_export():
+    query, params = rollups.user_stats_query(*get_date_range())
     none_values = ['не', 'авторизованный', 'пользователь']
-    result += ','.join(fields) + '\n'
-    for record in users_stats:
-        if record.user_id is None:
-            result += ','.join(none_values) + ',' + str(record.entries_counter) + '\n'
-            continue
-        result += ','.join([str(getattr(record, field)) for field in fields]) + '\n'
-
-    return send_file(BytesIO(result.encode()), as_attachment=True, mimetype='text/csv', download_name='user_export.csv')
+    rows = ((none_values if record.user_id is None else
+             [record.last_name, record.first_name, record.middle_name]) + [record.entries_counter]
+            for record in iter_rows(db_connector.connect(read_only=True), query, params,
+                                    current_app.config['EXPORT_CHUNK_SIZE']))
+    return csv_response('user_export.csv', ['last_name', 'first_name', 'middle_name', 'entries_counter'], rows,
+                        compress=request.args.get('gzip', type=int) == 1)
 
 
 @bp.route('/pages_stats')
-@db_operation
 @login_required
 @check_for_privelege('read_statistics')
-def pages_stats(cursor):
-    pages_stats = get_page_stats(cursor)
+@cached(ttl=lambda: current_app.config['ROLLUP_INTERVAL'], vary=lambda: current_user.role_id)
+@async_db_operation(read_only=True)
+async def pages_stats(run):
+    pages_stats = await run(rollups.get_page_stats)
     return render_template("user_actions/pages_stats.html", pages_stats=pages_stats)
 
 
 @bp.route('/pages_export.csv')
-@db_operation
 @login_required
 @check_for_privelege('read_statistics')
-def pages_export(cursor):
-    pages_stats = get_page_stats(cursor)
+def pages_export():
+    query, params = rollups.page_stats_query(*get_date_range())
+    rows = ((index, record.path, record.visits_count) for index, record
+            in enumerate(iter_rows(db_connector.connect(read_only=True), query, params,
+                                   current_app.config['EXPORT_CHUNK_SIZE']), start=1))
+    return csv_response('pages_export.csv', ['№', 'Page', 'Visits Count'], rows,
+                        compress=request.args.get('gzip', type=int) == 1)
 
-    result = '№,Page,Visits Count\n'
-    for index, record in enumerate(pages_stats, start=1):
-        result += f'{index},{record.path},{record.visits_count}\n'
 
-    return send_file(BytesIO(result.encode()), as_attachment=True, mimetype='text/csv',
-                     download_name='pages_export.csv')
+def get_date_range():
+    start = request.args.get('from', type=datetime.fromisoformat)
+    end = request.args.get('to', type=datetime.fromisoformat)
+    if end is not None and len(request.args['to']) == 10:
+        end += timedelta(days=1)
+    return start, end
 
 
-def get_page_stats(cursor):
-    query = ("SELECT path, COUNT(*) AS visits_count "
-             "FROM user_actions "
-             "GROUP BY path "
-             "ORDER BY visits_count DESC")
-    cursor.execute(query)
-    return cursor.fetchall()
+@bp.errorhandler(AnalyticsError)
+@bp.errorhandler(RangeError)
+def analytics_error(error):
+    return jsonify(error=str(error)), 400
+
+
+@bp.route('/api/visits')
+@login_required
+@check_for_privelege('read_statistics')
+@async_db_operation(read_only=True)
+async def api_visits(run):
+    start, end = get_analytics_range()
+    visits = partial(analytics.visits, path=request.args.get('path'), user_id=request.args.get('user_id', type=int))
+    series = await run(visits, start, end, request.args.get('bucket', 'hour'))
+    return jsonify(start=start.isoformat(), end=end.isoformat(), visits=series)
+
+
+@bp.route('/api/top/<key>')
+@login_required
+@check_for_privelege('read_statistics')
+@async_db_operation(read_only=True)
+async def api_top(run, key):
+    start, end = get_analytics_range()
+    top = await run(analytics.top, start, end, key, request.args.get('limit', 10, type=int))
+    return jsonify(start=start.isoformat(), end=end.isoformat(), top=top)
+
+
+@bp.route('/api/distribution/<key>')
+@login_required
+@check_for_privelege('read_statistics')
+@async_db_operation(read_only=True)
+async def api_distribution(run, key):
+    start, end = get_analytics_range()
+    percentiles = [int(p) for p in request.args.get('percentiles', '50,90,95,99').split(',') if p.isdigit()]
+    distribution = await run(analytics.distribution, start, end, key, [p for p in percentiles if 0 < p <= 100])
+    return jsonify(start=start.isoformat(), end=end.isoformat(), distribution=distribution)
+
+
+def get_analytics_range():
+    start, end = get_date_range()
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise AnalyticsError('Начало интервала должно быть раньше конца')
+    return start, end
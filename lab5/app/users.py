@@ -1,24 +1,34 @@
-import mysql.connector as connector
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import io
+
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app
 from flask_login import login_required, current_user
 
-from app import db_connector, db_operation
-from auto import check_for_privelege
+from auto import check_for_privelege, get_user, forget_user
+from bulk_users import EXPORT_COLUMNS, EXPORT_QUERY, FORMATS, ImportFormatError, read_rows
+from exports import csv_response, iter_csv, iter_jsonl, iter_rows, jsonl_response
+from extensions import async_db_operation, cached, db_connector, db_operation, importer, page_cache, passwords, refdata
+from mysqldb import connector
+from passwords import PasswordHasherBusy
+from user_listing import UserListing
+from validation import user_validator
 
 bp = Blueprint('users', __name__, url_prefix='/users')
 
 
-def get_roles(cursor):
-    cursor.execute("SELECT * FROM roles")
-    return cursor.fetchall()
+def get_roles():
+    return refdata.get('roles')
 
 
 @bp.route('/')
-@db_operation
-def index(cursor):
-    cursor.execute("SELECT users.*, roles.name AS role FROM users LEFT JOIN roles ON users.role_id = roles.id")
-    users = cursor.fetchall()
-    return render_template('users/index.html', users=users)
+@cached(ttl=30, tags=('users',), vary=lambda: current_user.get_id())
+@async_db_operation(read_only=True)
+async def index(run):
+    listing = UserListing(request.args)
+    users = await run(listing.fetch)
+    if request.args.get('format') == 'json':
+        return listing.json_response(users)
+    return render_template('users/index.html', users=users, listing=listing, roles=get_roles())
 
 
 @bp.route('/<int:user_id>/delete', methods=['POST'])
@@ -28,6 +38,9 @@ def index(cursor):
 def delete(cursor, user_id):
     query = ("DELETE FROM users WHERE id = %s")
     cursor.execute(query, (user_id,))
+    forget_user(user_id)
+    db_connector.mark_written()
+    db_connector.after_commit(page_cache.invalidate, 'users')
     flash('Учетная запись успешно удалена', 'success')
     return redirect(url_for('users.index'))
 
@@ -38,39 +51,41 @@ def delete(cursor, user_id):
 @db_operation
 def new(cursor):
     user_data = {}
+    errors = {}
     if request.method == 'POST':
         fields = ('login', 'password', 'first_name', 'middle_name', 'last_name', 'role_id')
         user_data = {field: request.form[field] or None for field in fields}
-        try:
-            query = (
-                "INSERT INTO users (login, password_hash, first_name, middle_name, last_name, role_id) VALUES "
-                "(%(login)s, SHA2(%(password)s, 256), %(first_name)s, %(middle_name)s, %(last_name)s, %(role_id)s)"
-            )
-            cursor.execute(query, user_data)
-            print(cursor.statement)
-            flash('Учетная запись успешно создана', 'success')
-            return redirect(url_for('users.index'))
-        except connector.errors.DatabaseError:
-            flash('Произошла ошибка при создании записи. Проверьте, что все необходимые поля заполнены', 'danger')
-
-    return render_template('users/new.html', user_data=user_data, roles=get_roles(cursor))
+        errors = user_validator.validate(user_data)
+        if not errors:
+            try:
+                query = (
+                    "INSERT INTO users (login, password_hash, first_name, middle_name, last_name, role_id) VALUES "
+                    "(%(login)s, %(password_hash)s, %(first_name)s, %(middle_name)s, %(last_name)s, %(role_id)s)"
+                )
+                cursor.execute(query, dict(user_data, password_hash=passwords.hash(user_data['password'])))
+                forget_user(cursor.lastrowid)
+                db_connector.mark_written()
+                db_connector.after_commit(page_cache.invalidate, 'users')
+                flash('Учетная запись успешно создана', 'success')
+                return redirect(url_for('users.index'))
+            except PasswordHasherBusy:
+                flash('Сервер перегружен, попробуйте позже', 'warning')
+                return render_template('users/new.html', user_data=user_data, roles=get_roles(), errors={}), 503
+            except connector.errors.DatabaseError:
+                flash('Произошла ошибка при создании записи. Проверьте, что все необходимые поля заполнены', 'danger')
+
+    return render_template('users/new.html', user_data=user_data, roles=get_roles(), errors=errors)
 
 
 @bp.route('/<int:user_id>/view')
 @check_for_privelege('read')
 def view(user_id):
-    user_data = {}
-    with db_connector.connect().cursor(named_tuple=True, buffered=True) as cursor:
-        query = ("SELECT * FROM users WHERE id = %s")
-        cursor.execute(query, [user_id])
-        user_data = cursor.fetchone()
-        if user_data is None:
-            flash('Пользователя нет в базе данных', 'danger')
-            return redirect(url_for('users.index'))
-        query = "SELECT name FROM roles WHERE id = %s"
-        cursor.execute(query, [user_data.role_id])
-        user_role = cursor.fetchone()
-        return render_template('users/view.html', user_data=user_data, user_role=user_role.name)
+    user_data = get_user(user_id)
+    if user_data is None:
+        flash('Пользователя нет в базе данных', 'danger')
+        return redirect(url_for('users.index'))
+    user_role = get_roles().get(user_data.role_id)
+    return render_template('users/view.html', user_data=user_data, user_role=user_role.name if user_role else None)
 
 
 @bp.route('/<int:user_id>/edit', methods=['POST', 'GET'])
@@ -78,27 +93,106 @@ def view(user_id):
 @check_for_privelege('update')
 @db_operation
 def edit(cursor, user_id):
-    query = ("SELECT first_name, middle_name, last_name, role_id "
-             "FROM users WHERE id = %s")
-    cursor.execute(query, [user_id])
-    user_data = cursor.fetchone()
+    user_data = get_user(user_id)
     if user_data is None:
         flash('Пользователя нет в базе данных', 'danger')
-        return redirect(url_for('users'))
+        return redirect(url_for('users.index'))
 
+    errors = {}
     if request.method == 'POST':
         fields = ['first_name', 'middle_name', 'last_name', 'role_id']
         if not current_user.can('assign_role'):
             fields.remove('role_id')
         user_data = {field: request.form[field] or None for field in fields}
         user_data['id'] = user_id
-        try:
-            field_assignments = ', '.join([f"{field} = %({field})s" for field in fields])
-            query = (f"UPDATE users SET {field_assignments} "
-                     "WHERE id = %(id)s")
-            cursor.execute(query, user_data)
-            flash('Учетная запись успешно изменена', 'success')
-            return redirect(url_for('users.index'))
-        except connector.errors.DatabaseError as error:
-            flash(f'Произошла ошибка при изменении записи: {error}', 'danger')
-    return render_template('users/edit.html', user_data=user_data, roles=get_roles(cursor))
+        errors = user_validator.validate(user_data, ('first_name', 'last_name'))
+        if not errors:
+            try:
+                field_assignments = ', '.join([f"{field} = %({field})s" for field in fields])
+                query = (f"UPDATE users SET {field_assignments} "
+                         "WHERE id = %(id)s")
+                cursor.execute(query, user_data)
+                forget_user(user_id)
+                db_connector.mark_written()
+                db_connector.after_commit(page_cache.invalidate, 'users')
+                flash('Учетная запись успешно изменена', 'success')
+                return redirect(url_for('users.index'))
+            except connector.errors.DatabaseError as error:
+                flash(f'Произошла ошибка при изменении записи: {error}', 'danger')
+    return render_template('users/edit.html', user_data=user_data, roles=get_roles(), errors=errors)
+
+
+@bp.route('/import', methods=['POST'])
+@login_required
+@check_for_privelege('import_users')
+def import_users():
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or ('jsonl' if filename.endswith('.jsonl') else 'csv')
+    stream = upload.stream if upload else io.BytesIO(request.get_data())
+    try:
+        report = importer.run(read_rows(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), fmt))
+    except (ImportFormatError, UnicodeDecodeError) as error:
+        return jsonify(error=str(error)), 400
+    except PasswordHasherBusy:
+        # Batches committed before the hasher filled up stay imported.
+        db_connector.mark_written()
+        page_cache.invalidate('users')
+        return jsonify(error='Сервер перегружен, попробуйте позже'), 503
+    if report['created']:
+        db_connector.mark_written()
+        page_cache.invalidate('users')
+    return jsonify(report)
+
+
+@bp.route('/roles/invalidate', methods=['POST'])
+@login_required
+@check_for_privelege('assign_role')
+def invalidate_roles():
+    # Roles are edited outside the application; this picks up a change before the next checksum poll.
+    refdata.invalidate('roles')
+    page_cache.invalidate('users')
+    return jsonify(roles=len(get_roles()))
+
+
+@bp.route('/export.<fmt>')
+@login_required
+@check_for_privelege('export_users')
+def export_users(fmt):
+    if fmt not in FORMATS:
+        abort(404)
+    rows = iter_rows(db_connector.connect(read_only=True), EXPORT_QUERY, (),
+                     current_app.config['EXPORT_CHUNK_SIZE'])
+    compress = request.args.get('gzip', type=int) == 1
+    if fmt == 'jsonl':
+        return jsonl_response('users.jsonl', (row._asdict() for row in rows), compress)
+    return csv_response('users.csv', EXPORT_COLUMNS, rows, compress)
+
+
+@bp.cli.command('import', help='Импорт пользователей из CSV или JSON Lines.')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='По умолчанию определяется по расширению файла')
+def import_command(file, fmt):
+    fmt = fmt or ('jsonl' if file.name.endswith('.jsonl') else 'csv')
+    try:
+        report = importer.run(read_rows(file, fmt))
+    except ImportFormatError as error:
+        raise click.ClickException(str(error))
+    except PasswordHasherBusy:
+        raise click.ClickException('Хеширование паролей перегружено, попробуйте позже')
+    for error in report['errors']:
+        click.echo(f"{error['line']}: {error['login'] or ''} {error['errors']}", err=True)
+    click.echo(f"Создано: {report['created']}, ошибок: {report['failed']}, всего строк: {report['total']}")
+    if report['failed']:
+        raise SystemExit(1)
+
+
+@bp.cli.command('export', help='Выгрузка пользователей в CSV или JSON Lines.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+@click.option('--output', type=click.File('wb'), default='-')
+def export_command(fmt, output):
+    with db_connector.read_connection() as connection:
+        rows = iter_rows(connection, EXPORT_QUERY, (), current_app.config['EXPORT_CHUNK_SIZE'])
+        chunks = iter_jsonl(row._asdict() for row in rows) if fmt == 'jsonl' else iter_csv(EXPORT_COLUMNS, rows)
+        for chunk in chunks:
+            output.write(chunk)
@@ -1,23 +1,33 @@
-from flask_login import current_user
+ACTIONS = ('create', 'read', 'update', 'delete', 'assign_role', 'read_statistics', 'import_users', 'export_users')
 
-class UsersPolicy:
-    def __init__(self, user):
-        self.user = user
+# Действия, которые пользователь может выполнять над своей учетной записью при любой роли.
+OWNER_ACTIONS = frozenset({'update'})
 
-    def create(self):
-        return current_user.is_admin()
 
-    def read(self):
-        return True
+class UsersPolicy:
+    def __init__(self, app):
+        admin_role_id = app.config['ADMIN_ROLE_ID']
+        matrix = app.config.get('ROLE_PERMISSIONS') or {admin_role_id: ACTIONS}
+        public = frozenset(app.config.get('PUBLIC_PERMISSIONS', ('read',)))
+        unknown = {action for actions in matrix.values() for action in actions} - set(ACTIONS)
+        if unknown:
+            raise ValueError(f'Неизвестные действия в ROLE_PERMISSIONS: {", ".join(sorted(unknown))}')
+        self.public = public
+        self.matrix = {role_id: frozenset(actions) | public for role_id, actions in matrix.items()}
 
-    def update(self):
-        return current_user.is_admin() or current_user.id == self.user.id
+    def actions(self, role_id):
+        return self.matrix.get(role_id, self.public)
 
-    def delete(self):
-        return current_user.is_admin()
+    def needs_target(self, actions, action):
+        return action not in actions and action in OWNER_ACTIONS
 
-    def assign_role(self):
-        return current_user.is_admin()
+    def allows(self, actions, user_id, action, target=None):
+        if action in actions:
+            return True
+        return action in OWNER_ACTIONS and target is not None and target.id == user_id
 
-    def read_statistics(self):
-        return current_user.is_dadmin()
\ No newline at end of file
+    def allows_many(self, actions, user_id, action, targets):
+        if action in actions:
+            return {target.id: True for target in targets}
+        owner = action in OWNER_ACTIONS
+        return {target.id: owner and target.id == user_id for target in targets}
@@ -0,0 +1,116 @@
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from fake_db import FakeDatabase  # noqa: E402
+from run import percentile  # noqa: E402
+
+PATHS = ('/user_actions/', '/user_actions/?page=2', '/users/1/view')
+
+
+def serve_wsgi(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def serve_asgi(app):
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit('Для режима asgi нужен uvicorn: pip install uvicorn')
+    from asgi import Application
+
+    server = uvicorn.Server(uvicorn.Config(Application(app), host='127.0.0.1', port=0, log_level='warning',
+                                           lifespan='on'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    def stop():
+        server.should_exit = True
+
+    return port, stop
+
+
+def client(port, paths, deadline, remaining, latencies, errors, lock):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    index = 0
+    while time.monotonic() < deadline:
+        with lock:
+            if remaining[0] <= 0:
+                break
+            remaining[0] -= 1
+        start = time.perf_counter()
+        try:
+            connection.request('GET', paths[index % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            status = 599
+        elapsed = time.perf_counter() - start
+        index += 1
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors[0] += 1
+    connection.close()
+
+
+def measure(port, args):
+    latencies, errors, remaining, lock = [], [0], [args.requests], threading.Lock()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(client, port, PATHS, start + args.duration, remaining, latencies, errors, lock)
+    duration = time.monotonic() - start
+    return len(latencies), errors[0], len(latencies) / duration, percentile(latencies, 50), percentile(latencies, 95)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сравнение WSGI и ASGI режимов lab5 при медленной базе')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--duration', type=float, default=60.0, help='максимальная длительность, с')
+    parser.add_argument('--db-latency', type=float, default=0.02, help='задержка каждого запроса к fake-базе, с')
+    parser.add_argument('--pool-size', type=int, default=50, help='MYSQL_POOL_SIZE + MYSQL_POOL_MAX_OVERFLOW')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+
+    app.config.update(MYSQL_POOL_SIZE=args.pool_size, MYSQL_POOL_MAX_OVERFLOW=0, ASGI_THREADS=args.pool_size)
+    app.extensions['services'].db_connector.factory = FakeDatabase(200, 20000, args.db_latency).connect
+    servers = {'wsgi': serve_wsgi, 'asgi': serve_asgi}
+
+    print(f'{"mode":<8}{"req":>8}{"err":>6}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}')
+    for mode in args.modes.split(','):
+        port, stop = servers[mode](app)
+        try:
+            requests, errors, rps, p50, p95 = measure(port, args)
+        finally:
+            stop()
+        print(f'{mode:<8}{requests:>8}{errors:>6}{rps:>10.1f}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
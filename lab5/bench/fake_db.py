@@ -0,0 +1,346 @@
+import contextvars
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+PASSWORD = 'Benchmark1'
+
+
+@lru_cache(maxsize=None)
+def row_type(columns):
+    return namedtuple('Row', columns)
+
+
+class QueryCounter:
+    # Counts the queries of the current request. The tally lives in a context variable rather than on the
+    # thread, so that queries an async view runs on the DB executor are counted too.
+    def __init__(self):
+        self._tally = contextvars.ContextVar('queries', default=None)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self._tally.set([0])
+
+    @property
+    def count(self):
+        tally = self._tally.get()
+        return 0 if tally is None else tally[0]
+
+    def add(self):
+        tally = self._tally.get()
+        # Queries made outside a request, e.g. by a background refresh, are not counted.
+        if tally is not None:
+            with self._lock:
+                tally[0] += 1
+
+
+class FakeDatabase:
+    def __init__(self, users=1000, actions=100000, latency=0.0, seed=1):
+        rnd = random.Random(seed)
+        now = datetime.now().replace(microsecond=0)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.roles = {1: ('admin', 'Администратор'), 2: ('user', 'Пользователь')}
+        self.paths = ['/', '/users/', '/user_actions/', '/counter', '/secret', '/auto/auth'] + \
+                     [f'/users/{user_id}/view' for user_id in range(1, 51)]
+        self.users = {}
+        for user_id in range(1, users + 1):
+            self.users[user_id] = {
+                'id': user_id,
+                'login': 'admin' if user_id == 1 else f'user{user_id}',
+                'password_hash': hashlib.sha256(PASSWORD.encode()).hexdigest(),
+                'last_name': rnd.choice(['Иванов', 'Петров', 'Сидоров', 'Smith']),
+                'first_name': rnd.choice(['Иван', 'Пётр', 'Анна', 'John']),
+                'middle_name': rnd.choice([None, 'Иванович', 'Петровна']),
+                'role_id': 1 if user_id == 1 else 2,
+                'created_at': now - timedelta(days=rnd.randint(0, 700)),
+            }
+        self.action_count = actions
+        self.sessions = {}
+        self.action_start = now - timedelta(seconds=actions)
+        self.handlers = [(re.compile(pattern, re.I | re.S), handler) for pattern, handler in (
+            (r'^SELECT [\w, *]+ FROM users WHERE id', self._user_by_id),
+            (r'^SELECT login FROM users WHERE login IN', self._logins_taken),
+            (r'FROM users WHERE login', self._user_by_login),
+            (r'^UPDATE users SET password_hash', self._update_password),
+            (r'^INSERT INTO users', self._insert_users),
+            (r'FROM users ORDER BY id', self._users_export),
+            (r'FROM users LEFT JOIN roles', self._users_list),
+            (r'^SELECT name FROM roles WHERE id', self._role_name),
+            (r'^SELECT \* FROM roles', self._roles),
+            (r'^CHECKSUM TABLE roles', self._roles_checksum),
+            (r'AS entries_counter', self._user_stats),
+            (r'AS visits_count', self._page_stats),
+            (r'COUNT\(\*\) AS count', self._count),
+            (r'FROM user_actions LEFT JOIN users', self._actions),
+            (r'^SELECT last_action_id, pending_action_id', self._rollup_state),
+            (r'^SELECT purged_before FROM rollup_state', self._purged_before),
+            (r'^INSERT INTO user_actions', self._insert_actions),
+            (r'^SELECT data, expires_at FROM sessions WHERE id', self._session),
+            (r'^INSERT INTO sessions', self._save_session),
+            (r'^UPDATE sessions', self._touch_session),
+            (r'^DELETE FROM sessions WHERE id', self._delete_session),
+            (r'^DELETE FROM sessions WHERE expires_at', self._sweep_sessions),
+        )]
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def execute(self, query, params):
+        if self.latency:
+            time.sleep(self.latency)
+        for pattern, handler in self.handlers:
+            if pattern.search(query):
+                return handler(query, params or ())
+        return [], []
+
+    def _user_columns(self, user, columns):
+        return columns, [tuple(user[column] for column in columns)]
+
+    def _user_by_id(self, query, params):
+        columns = query[len('SELECT '):query.index(' FROM')].split(', ')
+        if columns == ['*']:
+            columns = list(next(iter(self.users.values())))
+        user = self.users.get(int(params[0]))
+        if user is None:
+            return columns, []
+        return self._user_columns(user, columns)
+
+    def _user_by_login(self, query, params):
+        columns = ['id', 'login', 'role_id', 'password_hash']
+        for user in self.users.values():
+            if user['login'] == params[0]:
+                return self._user_columns(user, columns)
+        return columns, []
+
+    def _update_password(self, query, params):
+        with self.lock:
+            self.users[int(params[1])]['password_hash'] = params[0]
+        return [], []
+
+    def _logins_taken(self, query, params):
+        logins = set(params)
+        return ['login'], [(user['login'],) for user in self.users.values() if user['login'] in logins]
+
+    def _insert_users(self, query, params):
+        if isinstance(params, dict):
+            params = [params[key] for key in ('login', 'password_hash', 'first_name', 'middle_name', 'last_name',
+                                              'role_id')]
+        with self.lock:
+            for start in range(0, len(params), 6):
+                user_id = max(self.users) + 1
+                login, password_hash, first_name, middle_name, last_name, role_id = params[start:start + 6]
+                self.users[user_id] = {
+                    'id': user_id, 'login': login, 'password_hash': password_hash, 'last_name': last_name,
+                    'first_name': first_name, 'middle_name': middle_name, 'role_id': role_id,
+                    'created_at': datetime.now().replace(microsecond=0),
+                }
+        return [], []
+
+    def _users_export(self, query, params):
+        columns = ['id', 'login', 'last_name', 'first_name', 'middle_name', 'role_id', 'created_at']
+        return columns, [tuple(user[column] for column in columns) for user in self.users.values()]
+
+    def _users_list(self, query, params):
+        columns = ['id', 'login', 'last_name', 'first_name', 'middle_name', 'role', 'created_at']
+        params = list(params)
+        users = list(self.users.values())
+        if 'role_id = %s' in query:
+            role_id = int(params.pop(0))
+            users = [user for user in users if user['role_id'] == role_id]
+        if 'LIKE %s' in query:
+            prefix = params.pop(0).rstrip('%').replace('\\', '')
+            users = [user for user in users if user['last_name'].startswith(prefix)]
+        if 'MATCH' in query:
+            words = [word.strip('+*').lower() for word in params.pop(0).split()]
+            users = [user for user in users if all(
+                any((user[field] or '').lower().startswith(word)
+                    for field in ('first_name', 'middle_name', 'last_name', 'login')) for word in words)]
+        limit, offset = int(params[-2]), int(params[-1])
+        return columns, [(user['id'], user['login'], user['last_name'], user['first_name'], user['middle_name'],
+                          self.roles[user['role_id']][0], user['created_at']) for user in users[offset:offset + limit]]
+
+    def _role_name(self, query, params):
+        return ['name'], [(self.roles[int(params[0])][0],)]
+
+    def _roles(self, query, params):
+        return ['id', 'name', 'description'], [(role_id,) + role for role_id, role in self.roles.items()]
+
+    def _roles_checksum(self, query, params):
+        return ['Table', 'Checksum'], [('roles', hash(tuple(self.roles.items())))]
+
+    def _user_stats(self, query, params):
+        columns = ['user_id', 'last_name', 'first_name', 'middle_name', 'entries_counter']
+        rows = [(None, None, None, None, self.action_count // 2)]
+        rows += [(user['id'], user['last_name'], user['first_name'], user['middle_name'], 10)
+                 for user in self.users.values()]
+        return columns, rows
+
+    def _page_stats(self, query, params):
+        return ['path', 'visits_count'], [(path, 1000 - index) for index, path in enumerate(self.paths)]
+
+    def _count(self, query, params):
+        limit = params[-1] if params else self.action_count
+        return ['count'], [(min(self.action_count, limit),)]
+
+    def _actions(self, query, params):
+        columns = ['id', 'last_name', 'first_name', 'middle_name', 'path', 'created_at']
+        limit = min(int(params[-2] if 'OFFSET' in query else params[-1]), 100)
+        rows = []
+        for offset in range(limit):
+            action_id = self.action_count - offset
+            rows.append((action_id, None, None, None, self.paths[action_id % len(self.paths)],
+                         self.action_start + timedelta(seconds=action_id)))
+        return columns, rows
+
+    def _rollup_state(self, query, params):
+        return ['last_action_id', 'pending_action_id', 'purged_before'], [(self.action_count, self.action_count, None)]
+
+    def _purged_before(self, query, params):
+        return ['purged_before'], [(None,)]
+
+    def _insert_actions(self, query, params):
+        with self.lock:
+            self.action_count += len(params) // 3
+        return [], []
+
+    def _session(self, query, params):
+        sid, now = params
+        item = self.sessions.get(sid)
+        return ['data', 'expires_at'], [item] if item is not None and item[1] >= now else []
+
+    def _save_session(self, query, params):
+        sid, data, expires_at = params
+        with self.lock:
+            self.sessions[sid] = (data, expires_at)
+        return [], []
+
+    def _touch_session(self, query, params):
+        expires_at, sid = params
+        with self.lock:
+            if sid in self.sessions:
+                self.sessions[sid] = (self.sessions[sid][0], expires_at)
+        return [], []
+
+    def _delete_session(self, query, params):
+        with self.lock:
+            self.sessions.pop(params[0], None)
+        return [], []
+
+    def _sweep_sessions(self, query, params):
+        with self.lock:
+            for sid in [sid for sid, item in self.sessions.items() if item[1] < params[0]]:
+                del self.sessions[sid]
+        return [], []
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, named_tuple=False, dictionary=False, buffered=False, **kwargs):
+        return FakeCursor(self.database, named_tuple, dictionary)
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, database, named_tuple=False, dictionary=False):
+        self.database = database
+        self.named_tuple = named_tuple
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+        self.statement = None
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def execute(self, query, params=()):
+        self.statement = query
+        columns, rows = self.database.execute(query, params)
+        self.description = [(column,) for column in columns]
+        self.with_rows = bool(columns)
+        if self.named_tuple and columns:
+            row = row_type(tuple(columns))
+            rows = [row(*values) for values in rows]
+        elif self.dictionary and columns:
+            rows = [dict(zip(columns, row)) for row in rows]
+        self.rows = list(rows)
+        self.rowcount = len(self.rows)
+        self.lastrowid = len(self.database.users) + 1
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        self.rows = []
+
+
+class CountingConnection:
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        self._counter.add()
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
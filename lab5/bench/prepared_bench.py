@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+QUERIES = {
+    'user_by_id': ("SELECT * FROM users WHERE id = %s", lambda user: (user.id,)),
+    'user_by_login': ("SELECT id, login, role_id, password_hash FROM users WHERE login = %s",
+                      lambda user: (user.login,)),
+    'role_by_id': ("SELECT name FROM roles WHERE id = %s", lambda user: (user.role_id,)),
+}
+
+
+def session_status(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN ('Com_stmt_prepare', 'Com_stmt_execute', "
+                       "'Com_select')")
+        return {name: int(value) for name, value in cursor.fetchall()}
+
+
+def run_text(connection, query, params, repeat):
+    start = time.perf_counter()
+    for index in range(repeat):
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            cursor.execute(query, params[index % len(params)])
+            cursor.fetchall()
+    return time.perf_counter() - start
+
+
+def run_prepared(db_connector, connection, query, params, repeat):
+    start = time.perf_counter()
+    for index in range(repeat):
+        db_connector.execute_prepared(query, params[index % len(params)], connection)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Текстовые запросы против подготовленных выражений на MySQL')
+    parser.add_argument('--repeat', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=100, help='сколько разных пользователей перебирать')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+
+    for key in ('MYSQL_USER', 'MYSQL_PASSWORD', 'MYSQL_HOST', 'MYSQL_DATABASE'):
+        if key in os.environ:
+            app.config[key] = os.environ[key]
+    db_connector = app.extensions['services'].db_connector
+
+    with app.app_context(), db_connector.pool.connection() as connection:
+        with connection.cursor(named_tuple=True, buffered=True) as cursor:
+            cursor.execute("SELECT id, login, role_id FROM users ORDER BY id LIMIT %s", (args.users,))
+            users = cursor.fetchall()
+        if not users:
+            raise SystemExit('В таблице users нет записей')
+
+        print(f'{"query":<16}{"mode":<10}{"us/exec":>10}{"speedup":>10}{"prepares":>10}{"executes":>10}')
+        for name, (query, make_params) in QUERIES.items():
+            params = [make_params(user) for user in users]
+            before = session_status(connection)
+            text = run_text(connection, query, params, args.repeat)
+            middle = session_status(connection)
+            prepared = run_prepared(db_connector, connection, query, params, args.repeat)
+            after = session_status(connection)
+            for mode, elapsed, start, end in (('text', text, before, middle), ('prepared', prepared, middle, after)):
+                print(f'{name:<16}{mode:<10}{elapsed / args.repeat * 1e6:>10.1f}{text / elapsed:>10.2f}'
+                      f'{end["Com_stmt_prepare"] - start["Com_stmt_prepare"]:>10}'
+                      f'{end["Com_stmt_execute"] - start["Com_stmt_execute"]:>10}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
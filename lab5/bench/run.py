@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from fake_db import PASSWORD, CountingConnection, FakeDatabase, QueryCounter  # noqa: E402
+
+DEFAULT_MIX = 'users=30,user_view=30,auth=5,user_actions=25,user_export=5,pages_export=5'
+
+
+def route_mix(database):
+    user_ids = list(database.users) if database else list(range(1, 101))
+    return {
+        'users': (False, lambda rnd: ('GET', '/users/', None)),
+        'user_view': (True, lambda rnd: ('GET', f'/users/{rnd.choice(user_ids)}/view', None)),
+        'auth': (None, lambda rnd: ('POST', '/auto/auth', {'username': 'admin', 'password': PASSWORD})),
+        'user_actions': (False, lambda rnd: ('GET', '/user_actions/', None)),
+        'user_export': (True, lambda rnd: ('GET', '/user_actions/user_export.csv', None)),
+        'pages_export': (True, lambda rnd: ('GET', '/user_actions/pages_export.csv', None)),
+        'users_stats': (True, lambda rnd: ('GET', '/user_actions/users_stats', None)),
+        'pages_stats': (True, lambda rnd: ('GET', '/user_actions/pages_stats', None)),
+        'api_visits': (True, lambda rnd: ('GET', '/user_actions/api/visits?bucket=day', None)),
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(ceil(p / 100 * len(values)), 1) - 1]
+
+
+def login(app):
+    client = app.test_client()
+    response = client.post('/auto/auth', data={'username': 'admin', 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Не удалось авторизоваться: {response.status_code}')
+    return client
+
+
+def worker(app, routes, names, weights, deadline, remaining, counter, samples, lock, seed):
+    rnd = random.Random(seed)
+    clients = {False: app.test_client(), True: login(app)}
+    while time.monotonic() < deadline:
+        with lock:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        name = rnd.choices(names, weights)[0]
+        authenticated, build = routes[name]
+        method, path, data = build(rnd)
+        client = clients[authenticated] if authenticated is not None else app.test_client()
+        counter.reset()
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append((name, elapsed, response.status_code, counter.count))
+
+
+def summarize(samples, duration):
+    def stats(items):
+        latencies = [elapsed for _, elapsed, _, _ in items]
+        return {
+            'requests': len(items),
+            'errors': sum(1 for _, _, status, _ in items if status >= 400),
+            'rps': len(items) / duration if duration else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000 if items else None,
+            'p95_ms': percentile(latencies, 95) * 1000 if items else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if items else None,
+            'queries_per_request': sum(count for _, _, _, count in items) / len(items) if items else None,
+        }
+
+    routes = {}
+    for sample in samples:
+        routes.setdefault(sample[0], []).append(sample)
+    return {'total': stats(samples), 'routes': {name: stats(items) for name, items in sorted(routes.items())}}
+
+
+def compare(result, baseline, max_latency_regression, max_throughput_regression):
+    failures = []
+    for name, current in [('total', result['total'])] + list(result['routes'].items()):
+        previous = baseline['total'] if name == 'total' else baseline['routes'].get(name)
+        if not previous or not previous['requests'] or not current['requests']:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_latency_regression):
+            failures.append(f'{name}: p95 {previous["p95_ms"]:.2f} -> {current["p95_ms"]:.2f} мс')
+        if name == 'total' and current['rps'] < previous['rps'] * (1 - max_throughput_regression):
+            failures.append(f'{name}: {previous["rps"]:.1f} -> {current["rps"]:.1f} req/s')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест приложения lab5')
+    parser.add_argument('--db', choices=('fake', 'mysql'), default='fake',
+                        help='fake: база в памяти процесса; mysql: сервер из config.py/переменных MYSQL_*')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=60.0, help='максимальная длительность, с')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--db-latency', type=float, default=0.0, help='задержка каждого запроса к fake-базе, с')
+    parser.add_argument('--replicas', type=int, default=0, help='сколько fake-реплик для чтения подключить')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=100000)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--max-latency-regression', type=float, default=0.2)
+    parser.add_argument('--max-throughput-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    db_connector = app.extensions['services'].db_connector
+
+    counter = QueryCounter()
+    database = None
+    if args.db == 'fake':
+        database = FakeDatabase(args.users, args.actions, args.db_latency)
+        connect = database.connect
+        # Replicas share the primary's data, so only the routing of reads is exercised.
+        app.config['MYSQL_REPLICAS'] = [f'replica-{index}' for index in range(1, args.replicas + 1)]
+        app.config['MYSQL_REPLICA_MAX_LAG'] = None
+    else:
+        for key in ('MYSQL_USER', 'MYSQL_PASSWORD', 'MYSQL_HOST', 'MYSQL_DATABASE'):
+            if key in os.environ:
+                app.config[key] = os.environ[key]
+        import mysql.connector
+        connect = lambda: mysql.connector.connect(**db_connector.get_config())
+    db_connector.factory = lambda: CountingConnection(connect(), counter)
+
+    routes = route_mix(database)
+    mix = parse_mix(args.mix)
+    unknown = set(mix) - set(routes)
+    if unknown:
+        parser.error(f'Неизвестные маршруты: {", ".join(sorted(unknown))}')
+    names, weights = list(mix), list(mix.values())
+
+    lock = threading.Lock()
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        _run(app, routes, names, weights, args, args.warmup, counter, [], lock)
+        duration, started_at = _run(app, routes, names, weights, args, args.requests, counter,
+                                    samples, lock)
+
+    result = {
+        'meta': {
+            'started_at': started_at,
+            'duration': duration,
+            'db': args.db,
+            'db_latency': args.db_latency,
+            'concurrency': args.concurrency,
+            'mix': mix,
+        },
+        **summarize(samples, duration),
+    }
+    if db_connector.replicas:
+        replicas = db_connector.replica_stats()
+        result['replicas'] = {key: value for key, value in replicas.items() if key != 'replicas'}
+    print(f'{"route":<16}{"req":>8}{"err":>6}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"q/req":>8}')
+    for name, stats in [('total', result['total'])] + list(result['routes'].items()):
+        print(f'{name:<16}{stats["requests"]:>8}{stats["errors"]:>6}{stats["rps"]:>10.1f}'
+              f'{stats["p50_ms"]:>10.2f}{stats["p95_ms"]:>10.2f}{stats["p99_ms"]:>10.2f}'
+              f'{stats["queries_per_request"]:>8.2f}')
+    if 'replicas' in result:
+        print(', '.join(f'{key}: {value}' for key, value in result['replicas'].items()))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures = compare(result, json.load(file), args.max_latency_regression, args.max_throughput_regression)
+        for failure in failures:
+            print(f'Регрессия: {failure}')
+        if failures:
+            return 1
+    return 0
+
+
+def _run(app, routes, names, weights, args, total, counter, samples, lock):
+    remaining = [total]
+    started_at = time.time()
+    start = time.monotonic()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(worker, app, routes, names, weights, deadline, remaining, counter, samples, lock,
+                                   seed) for seed in range(args.concurrency)]
+        for future in futures:
+            future.result()
+    return time.monotonic() - start, started_at
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+# Runs in a fresh interpreter, so every sample is a cold start of one worker.
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+sys.stdout.write(json.dumps({'import_ms': (imported - start) * 1000, 'create_ms': (created - imported) * 1000,
+                             'first_request_ms': (served - created) * 1000}))
+"""
+PHASES = ('import_ms', 'create_ms', 'first_request_ms')
+
+
+def parse_importtime(stderr):
+    # Imports made by the probe and by app.py, each with its dependencies folded in: what a cold start pays for them.
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1 or depth == 0 and name != 'app':
+            modules[name] = modules.get(name, 0) + int(cumulative_us) / 1000
+    return modules
+
+
+def sample():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=APP_DIR, capture_output=True,
+                            text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['total_ms'] = sum(timings[phase] for phase in PHASES)
+    return timings, parse_importtime(result.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Время холодного старта lab5 и самые дорогие импорты')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    samples = [sample() for _ in range(args.runs)]
+    timings = {key: statistics.median(timing[key] for timing, _ in samples) for key in PHASES + ('total_ms',)}
+    names = {name for _, modules in samples for name in modules}
+    imports = {name: statistics.median(modules.get(name, 0) for _, modules in samples) for name in names}
+    top = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f'{"phase":<20}{"median ms":>12}')
+    for key, value in timings.items():
+        print(f'{key:<20}{value:>12.1f}')
+    print()
+    print(f'{"import":<32}{"cumulative ms":>14}')
+    for name, value in top:
+        print(f'{name:<32}{value:>14.1f}')
+
+    result = {'runs': args.runs, 'python': sys.version.split()[0], 'timings': timings, 'imports': dict(top)}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        failures = [f'{key}: {baseline["timings"][key]:.1f} -> {value:.1f} мс' for key, value in timings.items()
+                    if key in baseline['timings'] and value > baseline['timings'][key] * (1 + args.max_regression)]
+        for failure in failures:
+            print(f'Регрессия: {failure}')
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
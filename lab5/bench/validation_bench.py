@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from validation import user_validator  # noqa: E402
+
+
+# The lab4 validators as they were before validation.py, kept here as the baseline.
+def legacy_validate_name(name):
+    errors = ""
+    try:
+        if not name:
+            raise ValueError("Имя не может быть пустым.")
+        if not re.match(r'^[a-zA-Zа-яА-ЯёЁ]+$', name):
+            raise ValueError("Имя должно содержать только буквы.")
+    except Exception as e:
+        errors = e
+    return errors
+
+
+def legacy_validate_login(login):
+    errors = ""
+    try:
+        if not login:
+            raise ValueError("Логин не может быть пустым.")
+        if len(login) < 5:
+            raise ValueError("Логин должен быть не менее 5 символов.")
+        if not login or not re.match(r'^[a-zA-Z0-9]+$', login):
+            raise ValueError("Логин должен состоять только из латинских букв и цифр.")
+    except Exception as e:
+        errors = e
+    return errors
+
+
+def legacy_validate_password(password):
+    errors = ""
+    try:
+        if not password:
+            raise ValueError("Пароль не может быть пустым.")
+        if len(password) < 8:
+            raise ValueError("Пароль должен содержать не менее 8 символов")
+        if len(password) > 128:
+            raise ValueError("Пароль должен содержать не более 128 символов")
+        if not re.search(r'[a-z]', password):
+            raise ValueError("Пароль должен содержать как минимум одну строчную букву")
+        if not re.search(r'[A-Z]', password):
+            raise ValueError("Пароль должен содержать как минимум одну заглавную букву")
+        if not re.search(r'\d', password):
+            raise ValueError("Пароль должен содержать как минимум одну цифру")
+        if not re.match(r'^[a-zA-Zа-яА-Я0-9~!@#$%^&*_+()[\]{}<>\\/|"\'.,:;]*$', password):
+            raise ValueError(
+                "Пароль должен состоять только из латинских или кириллических букв, арабских цифр и допустимых символов")
+        if ' ' in password:
+            raise ValueError("Пароль не должен содержать пробелов")
+    except Exception as e:
+        errors = e
+    return errors
+
+
+def legacy_validate(record):
+    errors = {
+        'login': legacy_validate_login(record['login']),
+        'password': legacy_validate_password(record['password']),
+        'first_name': legacy_validate_name(record['first_name']),
+        'last_name': legacy_validate_name(record['last_name']),
+    }
+    return {field: error for field, error in errors.items() if error}
+
+
+def make_records(count, invalid_ratio, seed=1):
+    rnd = random.Random(seed)
+    first_names = ['Иван', 'Пётр', 'Анна', 'John', 'Mary']
+    last_names = ['Иванов', 'Петров', 'Сидорова', 'Smith', 'Brown']
+    records = []
+    for index in range(count):
+        record = {
+            'login': f'user{index}',
+            'password': ''.join(rnd.choices(string.ascii_letters, k=10)) + 'Aa1',
+            'first_name': rnd.choice(first_names),
+            'last_name': rnd.choice(last_names),
+        }
+        if rnd.random() < invalid_ratio:
+            record[rnd.choice(list(record))] = rnd.choice(['', 'ab', 'with space 1A', 'Имя1'])
+        records.append(record)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сравнение старых валидаторов lab4 и validation.py')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--invalid-ratio', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    records = make_records(args.records, args.invalid_ratio)
+    cases = [
+        ('legacy', lambda: [legacy_validate(record) for record in records]),
+        ('validate', lambda: [user_validator.validate(record) for record in records]),
+        ('validate_many', lambda: user_validator.validate_many(records)),
+    ]
+    baseline = None
+    print(f'{"case":<16}{"best ms":>10}{"us/record":>12}{"speedup":>10}')
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f'{name:<16}{best * 1000:>10.2f}{best / len(records) * 1e6:>12.2f}{baseline / best:>10.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
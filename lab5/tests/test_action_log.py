@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Flask
+
+from action_log import ActionLog
+from rollups import Rollups
+
+
+class Cursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=()):
+        pass
+
+
+class Connection:
+    def cursor(self, **options):
+        return Cursor()
+
+    def commit(self):
+        pass
+
+
+class Pool:
+    @contextmanager
+    def connection(self):
+        yield Connection()
+
+
+class Connector:
+    pool = Pool()
+
+    def execute_prepared(self, query, params=(), connection=None):
+        return []
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(dict(ACTION_LOG_BATCH_SIZE=2, ACTION_LOG_FLUSH_INTERVAL=0.01), **config)
+    return app
+
+
+def test_failing_callback_keeps_the_writer_running():
+    calls = []
+    action_log = ActionLog(make_app(), Connector())
+    action_log.on_flush.append(lambda: 1 / 0)
+    action_log.on_flush.append(lambda: calls.append(True))
+    for _ in range(3):
+        action_log.record(1, '/')
+        action_log.flush()
+    assert len(calls) == 3
+    action_log.record(1, '/')
+    action_log.record(1, '/')
+    action_log.stop()
+    assert action_log.stats()['written'] == 5 and len(calls) >= 4
+
+
+def test_rollup_refresh_runs_off_the_writer_thread():
+    app = make_app(ROLLUP_INTERVAL=0)
+    rollups = Rollups(app, Connector())
+    started, release = threading.Event(), threading.Event()
+    threads = []
+
+    def refresh():
+        threads.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+
+    rollups.refresh = refresh
+    action_log = ActionLog(app, Connector())
+    action_log.on_flush.append(rollups.schedule_refresh)
+    action_log.record(1, '/')
+    action_log.flush()
+    assert started.wait(5)
+    action_log.record(1, '/')
+    action_log.flush()
+    assert action_log.stats()['written'] == 2
+    release.set()
+    assert threads[0] == 'rollups'
+
+
+class RecordingCursor(Cursor):
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, query, params=()):
+        self.statements.append((query, params))
+
+
+class RecordingConnector(Connector):
+    def __init__(self):
+        self.statements = []
+        self.pool = self
+
+    @contextmanager
+    def connection(self):
+        connection = Connection()
+        connection.cursor = lambda **options: RecordingCursor(self.statements)
+        yield connection
+
+
+def test_rows_are_dated_on_the_database_clock():
+    connector = RecordingConnector()
+    action_log = ActionLog(make_app(ACTION_LOG_BATCH_SIZE=3, ACTION_LOG_FLUSH_INTERVAL=60), connector)
+    action_log.record(1, '/')
+    time.sleep(0.05)
+    action_log.record(None, '/users/')
+    action_log.stop()
+    [(query, params)] = connector.statements
+    assert query.count('CURRENT_TIMESTAMP(6) - INTERVAL %s MICROSECOND') == 2
+    assert params[:2] == [1, '/'] and params[3:5] == [None, '/users/']
+    assert params[2] - params[5] >= 50000
@@ -0,0 +1,48 @@
+from flask import Flask
+
+from action_policy import ActionPolicy
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(ACTION_LOG_DEDUP_WINDOW=10, **config)
+
+    @app.route('/users/<int:user_id>/view')
+    def view(user_id):
+        return ''
+
+    return app
+
+
+def check(app, policy, path, user_id, remote_addr='10.0.0.1'):
+    with app.test_request_context(path, environ_base={'REMOTE_ADDR': remote_addr}):
+        return policy.check(lambda: user_id)
+
+
+def test_real_path_is_logged_by_default():
+    app = make_app()
+    policy = ActionPolicy(app)
+    assert check(app, policy, '/users/17/view', 1) == (1, '/users/17/view')
+
+
+def test_normalize_logs_the_route():
+    app = make_app(ACTION_LOG_NORMALIZE=True)
+    policy = ActionPolicy(app)
+    assert check(app, policy, '/users/17/view', 1) == (1, '/users/<int:user_id>/view')
+
+
+def test_repeated_hits_of_a_user_are_deduplicated():
+    app = make_app()
+    policy = ActionPolicy(app)
+    assert check(app, policy, '/users/17/view', 1) is not None
+    assert check(app, policy, '/users/17/view', 1) is None
+    assert check(app, policy, '/users/17/view', 2) is not None
+    assert policy.stats()['deduplicated'] == 1
+
+
+def test_anonymous_visitors_behind_one_address_are_all_logged():
+    app = make_app()
+    policy = ActionPolicy(app)
+    for _ in range(3):
+        assert check(app, policy, '/users/17/view', None) == (None, '/users/17/view')
+    assert policy.stats()['deduplicated'] == 0
@@ -0,0 +1,13 @@
+import extensions
+from app import create_app
+
+
+def test_create_app_twice_keeps_services_apart():
+    first, second = create_app(), create_app()
+    assert first.extensions['services'] is not second.extensions['services']
+    for app in (first, second):
+        assert 'users.index' in {rule.endpoint for rule in app.url_map.iter_rules()}
+        with app.app_context():
+            services = app.extensions['services']
+            assert extensions.db_connector._get_current_object() is services.db_connector
+            assert extensions.page_cache.stats() == services.page_cache.stats()
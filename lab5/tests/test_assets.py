@@ -0,0 +1,57 @@
+import io
+import os
+
+import pytest
+from flask import Flask
+
+import assets
+from assets import Assets
+
+STYLES = b'body { color: #222; }\n' * 200
+
+
+@pytest.fixture
+def app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'images').mkdir(parents=True)
+    (static / 'styles.css').write_bytes(STYLES)
+    if assets.Image is not None:
+        output = io.BytesIO()
+        assets.Image.new('RGB', (1600, 1200), 'navy').save(output, format='JPEG')
+        (static / 'images' / 'post.jpg').write_bytes(output.getvalue())
+    return Flask(__name__, static_folder=str(static))
+
+
+def built(app, name):
+    return os.path.exists(os.path.join(app.static_folder, name))
+
+
+@pytest.mark.skipif(assets.brotli is None or assets.Image is None, reason='brotli and Pillow are not installed')
+def test_build_with_optional_packages(app):
+    pipeline = Assets(app, thumbnails='images/*.jpg')
+    manifest = pipeline.build()
+    styles = manifest['styles.css']
+    assert built(app, styles + '.gz') and built(app, styles + '.br')
+    assert pipeline.thumbnail('images/post.jpg') == 'thumbs/images/post.jpg'
+    with assets.Image.open(os.path.join(app.static_folder, manifest['thumbs/images/post.jpg'])) as image:
+        assert image.width <= 720 and image.height <= 480
+
+    response = app.test_client().get('/static/' + styles, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_build_without_optional_packages(app, monkeypatch):
+    monkeypatch.setattr(assets, 'brotli', None)
+    monkeypatch.setattr(assets, 'Image', None)
+    pipeline = Assets(app, thumbnails='images/*.jpg')
+    manifest = pipeline.build()
+    styles = manifest['styles.css']
+    assert built(app, styles + '.gz') and not built(app, styles + '.br')
+    assert not any(name.startswith('thumbs/') for name in manifest)
+    assert pipeline.thumbnail('images/post.jpg') == 'images/post.jpg'
+
+    result = app.test_cli_runner().invoke(args=['assets', 'build'])
+    assert 'brotli не установлен' in result.output and 'Pillow не установлен' in result.output
+    response = app.test_client().get('/static/' + styles, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
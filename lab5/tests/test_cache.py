@@ -0,0 +1,54 @@
+from flask import Flask
+
+from cache import RefreshingCache, TTLCache
+from page_cache import PageCache
+
+
+def test_set_skipped_after_concurrent_invalidation():
+    cache = TTLCache(max_size=4, ttl=60)
+    token = cache.token()
+    cache.pop(1)
+    cache.set(1, 'old row', token=token)
+    assert cache.get(1) is None
+
+    cache.set(1, 'new row', token=cache.token())
+    assert cache.get(1) == 'new row'
+
+
+def test_lru_eviction():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert cache.get(2) is None and cache.get(1) == 'a'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_refreshing_cache_is_bounded():
+    cache = RefreshingCache(ttl=60, max_size=2)
+    for user_id in range(5):
+        assert cache.get(user_id, lambda: user_id * 10) == user_id * 10
+    assert 3 in cache and 4 in cache and 0 not in cache
+    assert cache.stats()['evictions'] == 3
+
+
+def test_page_rendered_during_invalidation_is_not_cached():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    page_cache = PageCache(app)
+    renders = []
+
+    @app.route('/users')
+    @page_cache.cached(tags=('users',))
+    def users():
+        renders.append(True)
+        if len(renders) == 1:
+            # A write commits and invalidates while this page is being rendered from the old data.
+            page_cache.invalidate('users')
+        return f'render {len(renders)}'
+
+    client = app.test_client()
+    assert client.get('/users').text == 'render 1'
+    assert client.get('/users').text == 'render 2'
+    assert client.get('/users').text == 'render 2'
@@ -0,0 +1,34 @@
+import pytest
+from flask import Flask, abort
+
+from metrics import Metrics, normalize_sql
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.update(METRICS_TOKEN='scrape-token', METRICS_ALLOWED_ADDRESSES=('10.0.0.5',))
+    metrics = Metrics(app)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not metrics.authorized():
+            abort(403)
+        return metrics.render_prometheus()
+
+    return app.test_client()
+
+
+def test_metrics_refused_to_other_visitors(client):
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+
+def test_metrics_served_with_token_or_from_allowed_address(client):
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 200
+
+
+def test_normalize_sql_collapses_literals():
+    assert (normalize_sql("SELECT * FROM users WHERE id IN (%s, %s, %s) AND login = 'x'")
+            == "SELECT * FROM users WHERE id IN (...) AND login = ?")
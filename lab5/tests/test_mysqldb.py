@@ -0,0 +1,80 @@
+import pytest
+
+from flask import Flask
+
+from mysqldb import ConnectionPool, DBConnector, PoolTimeoutError
+
+
+class DeadConnection:
+    closed = False
+
+    def ping(self, reconnect=False):
+        raise OSError('Lost connection to MySQL server')
+
+    def close(self):
+        self.closed = True
+
+
+def test_failed_ping_keeps_pool_limit():
+    pool = ConnectionPool(DeadConnection, size=1, max_overflow=0, timeout=0.05)
+    for _ in range(4):
+        pool.release(pool.acquire())
+    assert pool._opening == 0
+    assert pool.stats()['open'] == 1
+
+    held = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(held)
+    assert pool.stats()['discarded'] == 4
+
+
+def test_recycled_connection_keeps_pool_limit():
+    pool = ConnectionPool(DeadConnection, size=1, max_overflow=0, timeout=0.05, recycle=0, ping=False)
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second is not first and first.closed
+    assert pool._opening == 0
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+
+class ReplicaCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [{'1': 1}]
+
+
+class ReplicaConnection:
+    def cursor(self, **kwargs):
+        return ReplicaCursor()
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_busy_replica_stays_healthy():
+    app = Flask(__name__)
+    app.config.update(MYSQL_REPLICAS=['replica-1'], MYSQL_REPLICA_CHECK_INTERVAL=0, MYSQL_POOL_SIZE=1,
+                      MYSQL_POOL_MAX_OVERFLOW=0, MYSQL_POOL_TIMEOUT=0.05)
+    db_connector = DBConnector(app, factory=ReplicaConnection)
+    replica, = db_connector.replicas
+    held = replica.pool.acquire()
+    assert db_connector.check_replicas() == {'replica-1': True}
+    assert replica.healthy
+    replica.pool.release(held)
@@ -0,0 +1,60 @@
+from collections import namedtuple
+from contextlib import contextmanager
+
+from flask import Flask
+
+from refdata import ReferenceData
+
+Role = namedtuple('Role', 'id name')
+
+
+class RolesConnector:
+    def __init__(self, available=True):
+        self.available = available
+        self.queries = []
+        self.pool = self
+        self._result = None
+
+    @contextmanager
+    def connection(self):
+        if not self.available:
+            raise ConnectionError('database is unreachable')
+        yield self
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        yield self
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self._result = [('roles', 1)] if query.startswith('CHECKSUM') else [Role(1, 'admin')]
+
+    def fetchall(self):
+        return self._result
+
+
+def make_refdata(connector):
+    refdata = ReferenceData(Flask(__name__), connector)
+    refdata.register('roles', "SELECT * FROM roles ORDER BY id", "CHECKSUM TABLE roles")
+    return refdata
+
+
+def test_preload_loads_registered_tables():
+    connector = RolesConnector()
+    refdata = make_refdata(connector)
+    refdata.preload()
+    queries = len(connector.queries)
+
+    assert refdata.get('roles').get(1).name == 'admin'
+    assert len(connector.queries) == queries
+    assert refdata.stats()['loads'] == 1
+
+
+def test_failed_preload_leaves_loading_to_the_first_get():
+    connector = RolesConnector(available=False)
+    refdata = make_refdata(connector)
+    refdata.preload()
+    assert refdata.stats()['failures'] == 1
+
+    connector.available = True
+    assert len(refdata.get('roles')) == 1
@@ -0,0 +1,71 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from rollups import RangeError, Rollups
+
+State = namedtuple('State', 'purged_before')
+
+
+class StateConnector:
+    def __init__(self, purged_before):
+        self.purged_before = purged_before
+        self.queries = []
+
+    @contextmanager
+    def primary_connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        yield self
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return State(self.purged_before)
+
+
+@pytest.fixture
+def rollups():
+    app = Flask(__name__)
+    app.config['ROLLUP_BUCKET'] = 'day'
+    return Rollups(app, StateConnector(None))
+
+
+def test_aligned_range_reads_rollups(rollups):
+    query, params = rollups.page_stats_query(datetime(2026, 1, 1), datetime(2026, 1, 3))
+    assert 'FROM path_visit_rollup' in query
+
+
+@pytest.mark.parametrize('start, end', [
+    (datetime(2026, 1, 1, 10, 30), datetime(2026, 1, 3)),
+    (datetime(2026, 1, 1), datetime(2026, 1, 2, 12)),
+    (None, datetime(2026, 1, 2, 0, 0, 1)),
+])
+def test_unaligned_range_reads_user_actions(rollups, start, end):
+    query, params = rollups.user_stats_query(start, end)
+    assert 'FROM user_actions' in query and 'user_visit_rollup' not in query
+    assert params == tuple(moment for moment in (start, end) if moment is not None)
+
+
+def test_unaligned_range_into_archive_is_refused(rollups):
+    rollups.purged_before = datetime(2026, 1, 1)
+    with pytest.raises(RangeError):
+        rollups.page_stats_query(datetime(2025, 12, 1, 3), None)
+    assert 'FROM path_visit_rollup' in rollups.page_stats_query(datetime(2025, 12, 1), None)[0]
+
+
+def test_archive_boundary_is_loaded_before_the_first_refresh():
+    app = Flask(__name__)
+    app.config['ROLLUP_BUCKET'] = 'day'
+    connector = StateConnector(datetime(2026, 1, 1))
+    rollups = Rollups(app, connector)
+    with pytest.raises(RangeError):
+        rollups.user_stats_query(datetime(2025, 12, 1, 3), None)
+    rollups.user_stats_query(datetime(2026, 2, 1, 3), None)
+    assert len(connector.queries) == 1
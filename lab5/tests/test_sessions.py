@@ -0,0 +1,127 @@
+import pytest
+from flask import Flask, session
+from flask_login import LoginManager, UserMixin, login_required, login_user, logout_user
+
+from mysqldb import DBConnector
+from sessions import MySQLStore, ServerSessions
+
+
+class User(UserMixin):
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', SESSION_STORE='memory', SESSION_SWEEP_INTERVAL=0)
+    app.server_sessions = ServerSessions(app)
+    login_manager = LoginManager(app)
+    login_manager.user_loader(User)
+
+    @app.route('/counter')
+    def counter():
+        session['counter'] = session.get('counter', 0) + 1
+        return str(session['counter'])
+
+    @app.route('/login')
+    def login():
+        login_user(User('1'))
+        return 'ok'
+
+    @app.route('/logout')
+    def logout():
+        logout_user()
+        return 'ok'
+
+    @app.route('/secret')
+    @login_required
+    def secret():
+        return 'secret'
+
+    return app
+
+
+def sid(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie is not None else None
+
+
+def test_login_issues_a_new_session_id(app):
+    client = app.test_client()
+    client.get('/counter')
+    planted = sid(client)
+    client.get('/login')
+    assert sid(client) != planted
+    assert client.get('/counter').text == '2'
+
+    attacker = app.test_client()
+    attacker.set_cookie('session', planted)
+    assert attacker.get('/secret').status_code == 401
+    assert app.server_sessions.store.load(planted) is None
+
+
+def test_logout_issues_a_new_session_id(app):
+    client = app.test_client()
+    client.get('/login')
+    signed_in = sid(client)
+    client.get('/logout')
+    assert sid(client) != signed_in
+    assert client.get('/secret').status_code == 401
+
+    attacker = app.test_client()
+    attacker.set_cookie('session', signed_in)
+    assert attacker.get('/secret').status_code == 401
+    assert app.server_sessions.stats()['rotated'] == 1
+
+
+def test_session_id_kept_between_logins(app):
+    client = app.test_client()
+    client.get('/counter')
+    first = sid(client)
+    client.get('/counter')
+    client.get('/secret')
+    assert sid(client) == first
+    assert app.server_sessions.stats()['rotated'] == 0
+
+
+class FakeCursor:
+    rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, **kwargs):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_mysql_store_does_not_compete_with_requests_for_the_pool():
+    app = Flask(__name__)
+    app.config.update(MYSQL_POOL_SIZE=1, MYSQL_POOL_MAX_OVERFLOW=0, MYSQL_POOL_TIMEOUT=0.05)
+    db_connector = DBConnector(app, factory=FakeConnection)
+    store = MySQLStore(db_connector, pool_size=1)
+    held = db_connector.pool.acquire()
+    store.touch('sid', 0)
+    store.delete('sid')
+    db_connector.pool.release(held)
+    assert store.pool.stats()['open'] == 1
@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+import pytest
+
+from app import create_app
+from passwords import PasswordHasherBusy
+from sessions import ServerSessions
+
+UserRow = namedtuple('UserRow', 'id login last_name first_name middle_name role_id created_at')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = create_app()
+    app.config.update(SESSION_STORE='memory', SESSION_SWEEP_INTERVAL=0)
+    ServerSessions(app)
+    services = app.extensions['services']
+    monkeypatch.setattr(services.action_log, 'record', lambda *args: None)
+    services.user_cache.set(1, UserRow(1, 'admin', None, 'Админ', None, app.config['ADMIN_ROLE_ID'], None))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def test_import_returns_json_503_when_the_hasher_is_busy(client, monkeypatch):
+    services = client.application.extensions['services']
+
+    def run(rows):
+        raise PasswordHasherBusy()
+
+    monkeypatch.setattr(services.importer, 'run', run)
+    response = client.post('/users/import', data=b'login,password\n', content_type='text/csv')
+    assert response.status_code == 503
+    assert 'error' in response.get_json()
@@ -0,0 +1,91 @@
+from collections import namedtuple
+
+import pytest
+from flask import Flask
+
+import config
+from users_policy import ACTIONS, UsersPolicy
+
+Target = namedtuple('Target', 'id')
+ADMIN_ROLE_ID = config.ADMIN_ROLE_ID
+USER_ROLE_ID = 2
+ADMIN_ID, USER_ID, OTHER_ID = 1, 5, 6
+
+# Expected decisions for every action: (admin on someone else, user on someone else, user on self).
+EXPECTED = {
+    'create': (True, False, False),
+    'read': (True, True, True),
+    'update': (True, False, True),
+    'delete': (True, False, False),
+    'assign_role': (True, False, False),
+    'read_statistics': (True, False, False),
+    'import_users': (True, False, False),
+    'export_users': (True, False, False),
+}
+
+
+@pytest.fixture
+def policy():
+    app = Flask(__name__)
+    app.config.from_object(config)
+    return UsersPolicy(app)
+
+
+def test_matrix_covers_every_action():
+    assert set(EXPECTED) == set(ACTIONS)
+
+
+@pytest.mark.parametrize('action', ACTIONS)
+def test_admin(policy, action):
+    actions = policy.actions(ADMIN_ROLE_ID)
+    assert policy.allows(actions, ADMIN_ID, action) is EXPECTED[action][0]
+    assert policy.allows(actions, ADMIN_ID, action, Target(OTHER_ID)) is EXPECTED[action][0]
+    assert policy.allows(actions, ADMIN_ID, action, Target(ADMIN_ID)) is EXPECTED[action][0]
+
+
+@pytest.mark.parametrize('action', ACTIONS)
+def test_user_on_other_account(policy, action):
+    actions = policy.actions(USER_ROLE_ID)
+    assert policy.allows(actions, USER_ID, action, Target(OTHER_ID)) is EXPECTED[action][1]
+
+
+@pytest.mark.parametrize('action', ACTIONS)
+def test_user_on_own_account(policy, action):
+    actions = policy.actions(USER_ROLE_ID)
+    assert policy.allows(actions, USER_ID, action, Target(USER_ID)) is EXPECTED[action][2]
+
+
+def test_self_edit_allowed_and_self_delete_refused(policy):
+    actions = policy.actions(USER_ROLE_ID)
+    assert policy.allows(actions, USER_ID, 'update', Target(USER_ID))
+    assert not policy.allows(actions, USER_ID, 'update')
+    assert not policy.allows(actions, USER_ID, 'delete', Target(USER_ID))
+    assert policy.needs_target(actions, 'update') and not policy.needs_target(actions, 'delete')
+
+
+def test_read_statistics_granted_to_admin_only(policy):
+    # The old policy called the nonexistent is_dadmin() and failed for everyone.
+    assert policy.allows(policy.actions(ADMIN_ROLE_ID), ADMIN_ID, 'read_statistics')
+    assert not policy.allows(policy.actions(USER_ROLE_ID), USER_ID, 'read_statistics')
+    assert not policy.allows(policy.actions(None), None, 'read_statistics')
+
+
+def test_unknown_role_gets_public_actions(policy):
+    assert policy.actions(99) == frozenset(config.PUBLIC_PERMISSIONS)
+    assert not policy.allows(policy.actions(99), 7, 'bogus')
+
+
+@pytest.mark.parametrize('action', ACTIONS)
+def test_allows_many_matches_allows(policy, action):
+    targets = [Target(ADMIN_ID), Target(USER_ID), Target(OTHER_ID)]
+    for role_id, user_id in ((ADMIN_ROLE_ID, ADMIN_ID), (USER_ROLE_ID, USER_ID)):
+        actions = policy.actions(role_id)
+        assert policy.allows_many(actions, user_id, action, targets) == {
+            target.id: policy.allows(actions, user_id, action, target) for target in targets}
+
+
+def test_unknown_action_in_config_fails_at_startup():
+    app = Flask(__name__)
+    app.config.update(ADMIN_ROLE_ID=1, ROLE_PERMISSIONS={1: ('read', 'read_statstics')})
+    with pytest.raises(ValueError):
+        UsersPolicy(app)